@@ -9,19 +9,31 @@ The building components.
 """
 
 import logging
+import multiprocessing
 import os
 import posixpath
+import weakref
+from contextlib import contextmanager
 from fnmatch import fnmatch
 from urllib.parse import urlparse
 
 from babel import Locale, dates
 from docutils.core import publish_parts
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
 from markupsafe import Markup
 from werkzeug import url_unquote
 from werkzeug.routing import Map, Rule
 
+from rstblog import highlight
+from rstblog.cache import (
+    DEFAULT_RENDER_CACHE_SIZE,
+    RENDER_CACHE_FILENAME,
+    RenderCache,
+    make_key,
+)
+from rstblog.manifest import MANIFEST_FILENAME, Manifest
 from rstblog.modules import find_module
+from rstblog.output import OutputWriter
 from rstblog.programs import CopyProgram, HTMLProgram, MarkdownProgram, SCSSProgram
 from rstblog.signals import (
     after_file_prepared,
@@ -30,13 +42,26 @@ from rstblog.signals import (
     before_file_built,
     before_file_processed,
     before_template_rendered,
+    send,
 )
+from rstblog.statcache import StatCache
+from rstblog.stats import BuildStats
+from rstblog.thumbnails import THUMBNAIL_INDEX_FILENAME, ThumbnailGenerator
+from rstblog.utils import IgnoreMatcher, fix_relative_urls
 
 logger = logging
 
 
 OUTPUT_FOLDER = "_build"
 
+#: folder of the project folder where what a build saves for the next ones,
+#: like the manifest, is stored. It is kept out of the output folder, so that
+#: it does not get deployed.
+CACHE_FOLDER = ".rstblog-cache"
+
+#: folder of the cache folder where compiled templates are cached
+TEMPLATE_CACHE_FOLDER = "templates"
+
 PROGRAM_CLASS_FOR_NAME = {
     "html": HTMLProgram,
     "copy": CopyProgram,
@@ -44,20 +69,57 @@ PROGRAM_CLASS_FOR_NAME = {
     "scss": SCSSProgram,
 }
 
+RST_FRAGMENT_MARKER = "<!-- rstblog-fragment-separator -->"
+RST_FRAGMENT_SEPARATOR = "\n.. raw:: html\n\n    %s\n\n" % RST_FRAGMENT_MARKER
+
 BUILTIN_TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), "templates")
 
 
 class Context:
     """Per rendering information"""
 
+    # Projects can have tens of thousands of contexts, keep them small. The
+    # last slots are set by programs and the bundled modules. Other modules
+    # store their attributes in `extra`.
+    __slots__ = (
+        "builder",
+        "_config",
+        "title",
+        "summary",
+        "pub_date",
+        "source_filename",
+        "links",
+        "dependencies",
+        "program_name",
+        "program",
+        "_destination_filename",
+        "_full_source_filename",
+        "_full_destination_filename",
+        "html",
+        "description",
+        "image",
+        "image_alt",
+        "tags",
+        "extra",
+        "__weakref__",
+    )
+
     def __init__(self, builder, config, source_filename, prepare=False):
         self.builder = builder
-        self.config = config
+        self._config = config
         self.title = "Untitled"
         self.summary = None
         self.pub_date = None
         self.source_filename = source_filename
         self.links = []
+        #: files read while preparing or building, besides the source file
+        self.dependencies = set()
+        #: attributes of the modules which have no slot
+        self.extra = {}
+        self._full_source_filename = os.path.join(
+            builder.project_folder, source_filename
+        )
+        self._full_destination_filename = None
         self.program_name = self.config.get("program")
         if self.program_name is None:
             self.program_name = self.builder.guess_program(config, source_filename)
@@ -66,18 +128,52 @@ class Context:
             self.builder.prefix_path.lstrip("/"), self.program.get_desired_filename()
         )
         if prepare:
-            try:
+            self.prepare()
+
+    @property
+    def config(self):
+        return self._config
+
+    @config.setter
+    def config(self, config):
+        # The output folder can be configured
+        self._config = config
+        self._full_destination_filename = None
+
+    @property
+    def destination_filename(self):
+        return self._destination_filename
+
+    @destination_filename.setter
+    def destination_filename(self, destination_filename):
+        self._destination_filename = destination_filename
+        self._full_destination_filename = None
+
+    def prepare(self, state=None):
+        """Prepares the program and sends the prepared signals. `state` is the
+        state a worker process prepared, if any: it is then restored instead
+        of preparing the program again."""
+        if state is None:
+            self.prepare_program()
+        else:
+            self.program.restore_state(state)
+        stats = self.builder.stats
+        send(after_file_prepared, self, stats)
+        if self.public:
+            send(after_file_published, self, stats)
+
+    def prepare_program(self):
+        name = "prepare %s" % type(self.program).__name__
+        try:
+            with self.builder.stats.measure(name, self.source_filename):
                 self.program.prepare()
-            except Exception:
-                logger.error("Failed to prepare %s", self.destination_filename)
-                raise
-            after_file_prepared.send(self)
-            if self.public:
-                after_file_published.send(self)
+        except Exception:
+            logger.error("Failed to prepare %s", self.destination_filename)
+            raise
 
     @property
     def is_new(self):
-        return not os.path.exists(self.full_destination_filename)
+        return not self.builder.stat_cache.exists(self.full_destination_filename)
 
     @property
     def is_text(self):
@@ -108,30 +204,56 @@ class Context:
 
     @property
     def full_destination_filename(self):
-        return os.path.join(
-            self.builder.project_folder,
-            self.config.get("output_folder") or OUTPUT_FOLDER,
-            self.destination_filename,
-        )
+        if self._full_destination_filename is None:
+            self._full_destination_filename = os.path.join(
+                self.builder.project_folder,
+                self.config.get("output_folder") or OUTPUT_FOLDER,
+                self.destination_filename,
+            )
+        return self._full_destination_filename
 
     @property
     def full_source_filename(self):
-        return os.path.join(self.builder.project_folder, self.source_filename)
+        return self._full_source_filename
 
     @property
     def full_source_metadata_filename(self):
-        base, _ = os.path.splitext(self.source_filename)
-        return os.path.join(self.builder.project_folder, base + ".yml")
+        base, _ = os.path.splitext(self._full_source_filename)
+        return base + ".yml"
 
     @property
     def needs_build(self):
-        if self.is_new:
+        stat_cache = self.builder.stat_cache
+        if not stat_cache.exists(self.full_destination_filename):
             return True
-        dst_time = os.path.getmtime(self.full_destination_filename)
-        metadata = self.full_source_metadata_filename
-        if os.path.exists(metadata) and dst_time < os.path.getmtime(metadata):
+        # Outputs are not rewritten when their content does not change, so
+        # their modification time does not tell when they were last built:
+        # compare the files they were built from to what they were then
+        built = self.builder.manifest.get_built(self.source_filename)
+        if built is None:
             return True
-        return dst_time < os.path.getmtime(self.full_source_filename)
+        sources = self.get_source_mtimes()
+        for filename, mtime in sources.items():
+            if built.get(filename) != mtime:
+                return True
+        for filename, mtime in built.items():
+            if filename not in sources and stat_cache.get_mtime(filename) != mtime:
+                return True
+        return False
+
+    def get_source_mtimes(self):
+        """Returns a dict mapping the source file, the metadata file and the
+        configuration files of the page to their modification time, or None
+        for missing files"""
+        filenames = [
+            self.full_source_filename,
+            self.full_source_metadata_filename,
+            *self.config.filenames,
+        ]
+        return {x: self.builder.stat_cache.get_mtime(x) for x in filenames}
+
+    def add_dependency(self, filename):
+        self.dependencies.add(filename)
 
     def get_default_template_context(self):
         return {
@@ -150,22 +272,114 @@ class Context:
         return self.builder.render_template(template_name, real_context)
 
     def render_rst(self, contents):
+        key = self._get_rst_key("rst", contents)
+        rv = self.get_cached_render(key)
+        if rv is None:
+            with self.recording_own_dependencies() as dependencies:
+                rv = self._publish_rst(contents)
+            self.set_cached_render(key, rv, dependencies)
+        return rv
+
+    def _publish_rst(self, contents):
         settings = {
             "initial_header_level": self.config.get("rst_header_level", 2),
             "rstblog_context": self,
         }
-        parts = publish_parts(
-            source=contents, writer_name="html4css1", settings_overrides=settings
-        )
+        with self.builder.stats.measure("docutils"):
+            parts = publish_parts(
+                source=contents, writer_name="html4css1", settings_overrides=settings
+            )
         return {
             "title": Markup(parts["title"]).striptags(),
             "html_title": Markup(parts["html_title"]),
             "fragment": Markup(parts["fragment"]),
         }
 
+    def render_rst_fragments(self, sources):
+        """Renders a list of independent rst sources, returns the list of their
+        HTML fragments.
+
+        Sources which are not in the render cache are rendered together in a
+        single docutils pass, with raw HTML separators between them.
+        """
+        keys = [self._get_rst_key("rst-fragment", x) for x in sources]
+        fragments = {}
+        missing = {}
+        for key, source in zip(keys, sources):
+            fragment = self.get_cached_render(key)
+            if fragment is None:
+                missing[key] = source
+            else:
+                fragments[key] = fragment
+
+        if missing:
+            # Dependencies cannot be told apart between fragments rendered
+            # together, so they are shared
+            with self.recording_own_dependencies() as dependencies:
+                rendered = self._render_rst_batch(list(missing.values()))
+            for key, fragment in zip(missing, rendered):
+                self.set_cached_render(key, fragment, dependencies)
+                fragments[key] = fragment
+
+        return [fragments[x] for x in keys]
+
+    def _get_rst_key(self, kind, source):
+        # Directives resolve paths relative to the document, so the same source
+        # can produce different fragments in different folders
+        return make_key(
+            kind,
+            source,
+            os.path.dirname(self.source_filename),
+            self.config.get("rst_header_level", 2),
+            self.builder.root_config_digest,
+        )
+
+    def _render_rst_batch(self, sources):
+        if len(sources) == 1:
+            return [self._publish_rst(sources[0])["fragment"]]
+        parts = self._publish_rst(RST_FRAGMENT_SEPARATOR.join(sources))
+        fragments = parts["fragment"].split(RST_FRAGMENT_MARKER)
+        if len(fragments) != len(sources):
+            # A source swallowed a separator, render them one by one
+            return [self._publish_rst(x)["fragment"] for x in sources]
+        return [Markup(x) for x in fragments]
+
+    def get_cached_render(self, key):
+        """Returns the value stored in the render cache for `key`, or None.
+        The dependencies recorded when it was rendered are added to the
+        context dependencies."""
+        rv = self.builder.render_cache.get(key)
+        if rv is None:
+            return None
+        value, dependencies = rv
+        self.dependencies.update(dependencies)
+        return value
+
+    def set_cached_render(self, key, value, dependencies=()):
+        dependencies = sorted(dependencies)
+        self.builder.render_cache.set(key, (value, dependencies), dependencies)
+
+    @contextmanager
+    def recording_own_dependencies(self):
+        """Collects the dependencies added within the block in a separate set,
+        which is merged into the context dependencies afterwards"""
+        dependencies = self.dependencies
+        self.dependencies = set()
+        try:
+            yield self.dependencies
+        finally:
+            self.dependencies = dependencies.union(self.dependencies)
+
     def render_contents(self):
         return self.program.render_contents()
 
+    def render_absolute_contents(self, base_url):
+        """Returns the contents with URLs made absolute using `base_url`, for use
+        outside of the site"""
+        contents = self.render_contents()
+        with self.builder.stats.measure("lxml"):
+            return fix_relative_urls(base_url, self.slug, contents)
+
     def render_summary(self):
         if not self.summary:
             return ""
@@ -186,20 +400,98 @@ class Context:
             }
         )
 
-    def run(self):
-        before_file_processed.send(self)
-        if self.needs_build:
+    def run(self, needs_build=None):
+        """Builds the page if needed. `needs_build` can be passed if it is
+        already known, to avoid checking it again."""
+        send(before_file_processed, self, self.builder.stats)
+        if needs_build is None:
+            needs_build = self.needs_build
+        if needs_build:
             self.build()
 
     def build(self):
-        before_file_built.send(self)
-        self.program.run()
+        stats = self.builder.stats
+        send(before_file_built, self, stats)
+        name = "build %s" % type(self.program).__name__
+        with self.builder.recording_dependencies(self.dependencies):
+            with stats.measure(name, self.source_filename):
+                self.program.run()
+        self.builder.stat_cache.invalidate(self.full_destination_filename)
 
 
 class BuildError(ValueError):
     pass
 
 
+# Contexts of a parallel build. Worker processes inherit them when they are
+# forked, so that contexts never have to be pickled.
+_pool_contexts = []
+
+
+def _prepare_in_worker(index):
+    context = _pool_contexts[index]
+    context.prepare_program()
+    builder = context.builder
+    return {
+        "source_filename": context.source_filename,
+        "manifest_entry": builder.manifest.get_entry(context.source_filename),
+        "render_cache_entries": builder.render_cache.take_new_entries(),
+        "render_cache_used_keys": builder.render_cache.take_used_keys(),
+        "thumbnail_entries": builder.thumbnails.take_new_entries(),
+        "stats": builder.stats.take(),
+    }
+
+
+def _run_in_worker(index):
+    context = _pool_contexts[index]
+    try:
+        context.run(needs_build=True)
+    except Exception:
+        logger.error("Failed to process %s", context.source_filename)
+        raise
+    builder = context.builder
+    return {
+        "dependencies": context.dependencies,
+        "render_cache_entries": builder.render_cache.take_new_entries(),
+        "render_cache_used_keys": builder.render_cache.take_used_keys(),
+        "thumbnail_entries": builder.thumbnails.take_new_entries(),
+        "stats": builder.stats.take(),
+    }
+
+
+class TemplateBytecodeCache(FileSystemBytecodeCache):
+    """A Jinja bytecode cache whose folder is created when needed"""
+
+    def dump_bytecode(self, bucket):
+        os.makedirs(self.directory, exist_ok=True)
+        super().dump_bytecode(bucket)
+
+
+class DependencyTrackingEnvironment(Environment):
+    """A Jinja environment which reports the files of the templates it loads
+    to its `dependency_recorder`, if any, and the time spent compiling
+    templates to its `stats`, if any"""
+
+    dependency_recorder = None
+    stats = None
+
+    def compile(self, *args, **kwargs):
+        if self.stats is None:
+            return super().compile(*args, **kwargs)
+        with self.stats.measure("template compilation"):
+            return super().compile(*args, **kwargs)
+
+    def _load_template(self, name, globals):
+        template = super()._load_template(name, globals)
+        if self.dependency_recorder is not None and template.filename:
+            self.dependency_recorder(template.filename)
+        return template
+
+
+def _get_chunksize(items, jobs):
+    return max(1, len(items) // (jobs * 4))
+
+
 class Builder:
     default_ignores = (
         ".*",
@@ -222,6 +514,19 @@ class Builder:
         self.config = config
         self.modules = []
         self.storage = {}
+        self.stats = BuildStats()
+        self.stat_cache = StatCache()
+        self.output = OutputWriter(
+            self.stats, self.config.root_get("copy_strategy", "copy")
+        )
+        #: absolute paths of the files changed since the previous build, or
+        #: None if they are not known
+        self.changes = None
+        #: prefixes of the files in the folders of `changes`, which are all
+        #: considered changed
+        self._changed_folder_prefixes = ()
+        #: maps configs to the IgnoreMatcher of their ignore patterns
+        self._ignore_matchers = weakref.WeakKeyDictionary()
         self.url_map = Map()
         parsed = urlparse(self.config.root_get("canonical_url"))
         self.prefix_path = parsed.path
@@ -230,15 +535,19 @@ class Builder:
         )
         self.register_url("page", "/<path:slug>")
 
-        template_path = os.path.join(
+        self.template_path = os.path.join(
             self.project_folder,
             self.config.root_get("template_path") or self.default_template_path,
         )
         self.locale = Locale(self.config.root_get("locale") or "en")
-        self.jinja_env = Environment(
-            loader=FileSystemLoader([template_path, BUILTIN_TEMPLATES_DIR]),
+        self.jinja_env = DependencyTrackingEnvironment(
+            loader=FileSystemLoader([self.template_path, BUILTIN_TEMPLATES_DIR]),
             autoescape=self.config.root_get("template_autoescape", True),
+            bytecode_cache=TemplateBytecodeCache(
+                os.path.join(self.cache_folder, TEMPLATE_CACHE_FOLDER)
+            ),
         )
+        self.jinja_env.stats = self.stats
         self.jinja_env.globals.update(
             link_to=self.link_to,
             format_datetime=self.format_datetime,
@@ -250,6 +559,31 @@ class Builder:
             self.config.root_get("static_folder") or self.default_static_folder
         )
 
+        # Prepared states and directive output depend on the root
+        # configuration, so it is part of their cache keys
+        self.root_config_digest = make_key(repr(sorted(self.config.stack[0].items())))
+        self.manifest = Manifest(
+            os.path.join(self.cache_folder, MANIFEST_FILENAME),
+            salt=self.root_config_digest,
+        )
+        cache_size = self.config.root_get(
+            "render_cache_size", DEFAULT_RENDER_CACHE_SIZE
+        )
+        self.render_cache = RenderCache(
+            os.path.join(self.cache_folder, RENDER_CACHE_FILENAME),
+            max_size=cache_size * 1024 * 1024,
+        )
+        # Highlighted code blocks are stored in the render cache
+        highlight.set_cache(self.render_cache)
+        highlight.install()
+        self.thumbnails = ThumbnailGenerator(
+            os.path.join(self.cache_folder, THUMBNAIL_INDEX_FILENAME),
+            max_workers=self.config.root_get("thumbnails.jobs"),
+            resample=self.config.root_get("thumbnails.resample", "bilinear"),
+            densities=self.config.root_get("thumbnails.densities", [1]),
+            formats=self.config.root_get("thumbnails.formats", []),
+        )
+
         for module in self.config.root_get("active_modules") or []:
             mod = find_module(module)
             mod.setup(self)
@@ -261,6 +595,12 @@ class Builder:
             self.project_folder, self.config.root_get("output_folder") or OUTPUT_FOLDER
         )
 
+    @property
+    def cache_folder(self):
+        return os.path.join(
+            self.project_folder, self.config.root_get("cache_folder") or CACHE_FOLDER
+        )
+
     def link_to(self, _key, **values):
         return self.url_adapter.build(_key, values)
 
@@ -272,10 +612,7 @@ class Builder:
 
     def open_link_file(self, _key, mode="w", **values):
         filename = self.get_link_filename(_key, **values)
-        folder = os.path.dirname(filename)
-        if not os.path.isdir(folder):
-            os.makedirs(folder)
-        return open(filename, mode)
+        return self.output.open(filename, mode)
 
     def register_url(
         self, key, rule=None, config_key=None, config_default=None, **extra
@@ -292,31 +629,93 @@ class Builder:
 
     def open_static_file(self, filename, mode="w"):
         full_filename = self.get_full_static_filename(filename)
-        folder = os.path.dirname(full_filename)
-        if not os.path.isdir(folder):
-            os.makedirs(folder)
-        return open(full_filename, mode)
+        return self.output.open(full_filename, mode)
+
+    def write_link_file_if_changed(self, _key, digest, write, **values):
+        """Calls `write(f)` to write the file of a URL, unless a previous
+        build wrote it from the same `digest`. `digest` must change whenever
+        what `write()` writes would, except for changes to the templates it
+        renders, which are tracked. Returns True if the file has been
+        written."""
+        filename = self.get_link_filename(_key, **values)
+        if self.manifest.is_output_up_to_date(filename, digest):
+            return False
+        dependencies = set()
+        with self.recording_dependencies(dependencies):
+            with self.open_link_file(_key, **values) as f:
+                write(f)
+        self.manifest.set_output(filename, digest, dependencies)
+        return True
 
     def get_storage(self, module):
         return self.storage.setdefault(module, {})
 
     def filter_files(self, files, config):
-        patterns = config.merged_get("ignore_files")
-        if patterns is None:
-            patterns = self.default_ignores
-
-        result = []
-        for filename in files:
-            for pattern in patterns:
-                if pattern[0] == "!":
-                    if fnmatch(filename, pattern[1:]):
-                        result.append(filename)
-                        break
-                elif fnmatch(filename, pattern):
-                    break
-            else:
-                result.append(filename)
-        return result
+        return self.get_ignore_matcher(config).filter(files)
+
+    def get_ignore_matcher(self, config):
+        """Returns the IgnoreMatcher for the ignore patterns of `config`,
+        compiled once per config"""
+        matcher = self._ignore_matchers.get(config)
+        if matcher is None:
+            patterns = config.merged_get("ignore_files")
+            if patterns is None:
+                patterns = self.default_ignores
+            matcher = IgnoreMatcher(patterns)
+            self._ignore_matchers[config] = matcher
+        return matcher
+
+    def get_relevant_changes(self, paths):
+        """Returns the paths from `paths` whose changes can affect the build:
+        the ones which are not ignored, configuration files, templates, and
+        the files used by the previous builds. The project folder itself,
+        which the watcher reports when it lost events, is always kept."""
+        used_files = self.manifest.get_used_files()
+        folder_configs = {}
+        rv = set()
+        for path in paths:
+            if (
+                path == self.project_folder
+                or path in used_files
+                or os.path.basename(path) == "config.yml"
+                or path.startswith(self.template_path + os.sep)
+                or not self._is_ignored(path, folder_configs)
+            ):
+                rv.add(path)
+        return rv
+
+    def _is_ignored(self, path, folder_configs):
+        """Returns True if walking the project skips `path`: each part of it
+        is matched against the ignore patterns of the config of its folder,
+        like `iter_contexts()` does. `folder_configs` caches the configs of
+        the folders."""
+        relpath = os.path.relpath(path, self.project_folder)
+        names = relpath.split(os.sep)
+        config = self.config
+        dirpath = self.project_folder
+        for idx, name in enumerate(names):
+            if self.get_ignore_matcher(config).is_ignored(name):
+                return True
+            if idx == len(names) - 1:
+                break
+            dirpath = os.path.join(dirpath, name)
+            sub_config = folder_configs.get(dirpath)
+            if sub_config is None:
+                sub_config = config
+                sub_config_filename = os.path.join(dirpath, "config.yml")
+                if os.path.isfile(sub_config_filename):
+                    with open(sub_config_filename) as f:
+                        sub_config = config.add_from_file(f)
+                folder_configs[dirpath] = sub_config
+            config = sub_config
+        return False
+
+    def is_unchanged(self, filename):
+        """Returns True if `filename` is known not to have changed since the
+        previous build"""
+        if self.changes is None or filename in self.changes:
+            return False
+        return not filename.startswith(self._changed_folder_prefixes)
 
     def guess_program(self, config, filename):
         mapping = config.list_entries("programs") or self.default_programs
@@ -331,8 +730,20 @@ class Builder:
         context["builder"] = self
         context.setdefault("config", self.config)
         tmpl = self.jinja_env.get_template(template_name)
-        before_template_rendered.send(tmpl, context=context)
-        return tmpl.render(context)
+        send(before_template_rendered, tmpl, self.stats, context=context)
+        with self.stats.measure("jinja"):
+            return tmpl.render(context)
+
+    @contextmanager
+    def recording_dependencies(self, dependencies):
+        """Adds the files of the templates rendered within the block to the
+        `dependencies` set"""
+        previous = self.jinja_env.dependency_recorder
+        self.jinja_env.dependency_recorder = dependencies.add
+        try:
+            yield
+        finally:
+            self.jinja_env.dependency_recorder = previous
 
     def format_datetime(self, datetime=None, format="medium"):
         return dates.format_datetime(datetime, format, locale=self.locale)
@@ -345,18 +756,25 @@ class Builder:
 
     def iter_contexts(self, prepare=True):
         cutoff = len(self.project_folder) + 1
+        # Skipped even if the ignore patterns do not match them
+        skipped_folders = {self.default_output_folder, self.cache_folder}
 
         def _walk(local_config, dirpath):
+            matcher = self.get_ignore_matcher(local_config)
             dirnames = []
             filenames = []
-            for f in os.listdir(dirpath):
-                if os.path.isdir(os.path.join(dirpath, f)):
-                    dirnames.append(f)
-                else:
-                    filenames.append(f)
-
-            dirnames[:] = self.filter_files(dirnames, local_config)
-            filenames = self.filter_files(filenames, local_config)
+            with self.stats.measure("walk"):
+                with os.scandir(dirpath) as it:
+                    entries = list(it)
+                self.stat_cache.add_scandir_entries(dirpath, entries)
+                for entry in entries:
+                    if matcher.is_ignored(entry.name):
+                        continue
+                    if entry.is_dir():
+                        if entry.path not in skipped_folders:
+                            dirnames.append(entry.name)
+                    else:
+                        filenames.append(entry.name)
 
             for dirname in dirnames:
                 sub_config_filename = os.path.join(dirpath, dirname, "config.yml")
@@ -378,26 +796,132 @@ class Builder:
 
         yield from _walk(self.config, self.project_folder)
 
+    def load(self):
+        """Loads what the previous build saved: the render cache, the
+        thumbnail index and the manifest"""
+        self.render_cache.load()
+        self.thumbnails.load()
+        self.manifest.load()
+
     def anything_needs_build(self):
+        self.stat_cache.clear()
+        self.load()
         for context in self.iter_contexts(prepare=False):
             if context.needs_build:
                 return True
         return False
 
-    def run(self):
+    def run(self, jobs=1, changes=None):
+        """Builds the project. If `jobs` is greater than 1, pages are prepared
+        and built by that many worker processes.
+
+        `changes` are the absolute paths of the files changed since the
+        previous build, if known. Other source files are then not read again
+        to find out whether they changed. All the files of the folders in
+        `changes`, like a folder moved into the project, are considered
+        changed.
+        """
+        if changes is not None and self.project_folder in changes:
+            changes = None
+        self.changes = changes
+        self._changed_folder_prefixes = tuple(
+            x + os.sep for x in changes or () if os.path.isdir(x)
+        )
         self.storage.clear()
+        self.stat_cache.clear()
+        self.load()
+        try:
+            self._run(jobs)
+        finally:
+            self.thumbnails.shutdown()
 
-        for context in self.iter_contexts():
-            if context.needs_build:
-                key = context.is_new and "A" or "U"
-                try:
-                    context.run()
-                except Exception:
-                    logger.error("Failed to process %s", context.source_filename)
-                    raise
-                print(key, context.source_filename)
-
-        before_build_finished.send(self)
+    def _run(self, jobs):
+        if jobs > 1 and "fork" in multiprocessing.get_all_start_methods():
+            self.run_parallel(jobs)
+        else:
+            for context in self.iter_contexts():
+                if context.needs_build:
+                    key = context.is_new and "A" or "U"
+                    try:
+                        context.run(needs_build=True)
+                    except Exception:
+                        logger.error("Failed to process %s", context.source_filename)
+                        raise
+                    self.manifest.set_built(
+                        context.source_filename,
+                        context.get_source_mtimes(),
+                        context.dependencies,
+                    )
+                    print(key, context.source_filename)
+
+        with self.stats.measure("before_build_finished"):
+            send(before_build_finished, self, self.stats)
+        self.manifest.save()
+        self.render_cache.save()
+        self.thumbnails.save()
+        self.thumbnails.remove_legacy_thumbnails()
+
+    def run_parallel(self, jobs):
+        global _pool_contexts
+        mp_context = multiprocessing.get_context("fork")
+        # Workers reset their inherited stats, so that they only report their
+        # own work
+        _pool_contexts = list(self.iter_contexts(prepare=False))
+        # Workers ask this process for their thumbnails, so that a thumbnail
+        # used by pages of several workers is only generated once
+        thumbnail_service = self.thumbnails.start_service()
+        try:
+            # Parse pages in the workers, then restore the states they
+            # prepared here. Signals are sent in the same order as in a
+            # sequential build.
+            indices = [
+                idx
+                for idx, context in enumerate(_pool_contexts)
+                if context.program.parallel_prepare
+            ]
+            states = {}
+            with mp_context.Pool(jobs, self.stats.reset) as pool:
+                results = pool.imap(
+                    _prepare_in_worker, indices, _get_chunksize(indices, jobs)
+                )
+                for idx, result in zip(indices, results):
+                    source_filename = result["source_filename"]
+                    self.manifest.set_entry(source_filename, result["manifest_entry"])
+                    states[idx] = self.manifest.get_state(source_filename)
+                    self.render_cache.add_entries(result["render_cache_entries"])
+                    self.render_cache.mark_used(result["render_cache_used_keys"])
+                    self.thumbnails.add_entries(result["thumbnail_entries"])
+                    self.stats.merge(result["stats"])
+            for idx, context in enumerate(_pool_contexts):
+                context.prepare(states.get(idx))
+
+            # Fork new workers now that all contexts are prepared, so that
+            # they see what the modules stored
+            todo = [
+                (idx, context.is_new and "A" or "U")
+                for idx, context in enumerate(_pool_contexts)
+                if context.needs_build
+            ]
+            indices = [idx for idx, key in todo]
+            with mp_context.Pool(jobs, self.stats.reset) as pool:
+                results = pool.imap(
+                    _run_in_worker, indices, _get_chunksize(indices, jobs)
+                )
+                for (idx, key), result in zip(todo, results):
+                    context = _pool_contexts[idx]
+                    self.manifest.set_built(
+                        context.source_filename,
+                        context.get_source_mtimes(),
+                        result["dependencies"],
+                    )
+                    self.render_cache.add_entries(result["render_cache_entries"])
+                    self.render_cache.mark_used(result["render_cache_used_keys"])
+                    self.thumbnails.add_entries(result["thumbnail_entries"])
+                    self.stats.merge(result["stats"])
+                    print(key, context.source_filename)
+        finally:
+            _pool_contexts = []
+            self.thumbnails.stop_service(thumbnail_service)
 
     def debug_serve(self, host="0.0.0.0", port=5000):
         from rstblog.server import Server
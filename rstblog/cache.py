@@ -0,0 +1,163 @@
+"""
+rstblog.cache
+~~~~~~~~~~~~~
+
+A persistent cache for rendered fragments, keyed by the digest of what they
+have been rendered from.
+
+:copyright: (c) 2026 by Aurélien Gâteau.
+:license: BSD, see LICENSE for more details.
+"""
+
+import hashlib
+import os
+import pickle
+from collections import OrderedDict
+
+from rstblog import picklefile
+from rstblog.manifest import get_mtime
+
+#: bump this when the format of cached values changes
+CACHE_VERSION = 1
+
+RENDER_CACHE_FILENAME = "render-cache"
+
+#: default maximum size of the render cache, in MiB
+DEFAULT_RENDER_CACHE_SIZE = 64
+
+
+def make_key(*parts):
+    """Returns a cache key for the given parts, which are converted to str"""
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class RenderCache:
+    """An LRU cache, saved in a file and bounded to `max_size` bytes of
+    pickled values.
+
+    A value can depend on files: it is then discarded when one of them
+    changes.
+
+    The values are only saved when some have been added or removed. When
+    they have only been used, the keys used since they have been saved are
+    saved in a small separate file, to keep the LRU order.
+    """
+
+    def __init__(self, filename, max_size):
+        self.filename = filename
+        self.order_filename = filename + "-order"
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.size = 0
+        self.new_entries = {}
+        self.used_keys = []
+        #: keys moved to the end of the LRU order since the entries have been
+        #: saved, in order
+        self.touched_keys = OrderedDict()
+        self.dirty = False
+        self.order_dirty = False
+
+    def load(self):
+        self.entries = OrderedDict()
+        self.size = 0
+        self.new_entries = {}
+        self.used_keys = []
+        self.touched_keys = OrderedDict()
+        self.dirty = False
+        self.order_dirty = False
+        entries = picklefile.load(self.filename, CACHE_VERSION, "cache")
+        if entries is None:
+            return
+        self.entries = entries
+        self.size = sum(len(x[0]) for x in entries.values())
+        for key in picklefile.load(self.order_filename, CACHE_VERSION) or ():
+            if key in entries:
+                entries.move_to_end(key)
+                self.touched_keys[key] = None
+
+    def save(self):
+        if self.dirty:
+            picklefile.save(self.filename, CACHE_VERSION, self.entries)
+            # The saved entries are in LRU order
+            try:
+                os.remove(self.order_filename)
+            except FileNotFoundError:
+                pass
+            self.touched_keys.clear()
+        elif self.order_dirty:
+            picklefile.save(self.order_filename, CACHE_VERSION, list(self.touched_keys))
+        self.dirty = False
+        self.order_dirty = False
+
+    def get(self, key):
+        """Returns the value stored for `key`, or None"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        blob, inputs = entry
+        for filename, mtime in inputs.items():
+            if get_mtime(filename) != mtime:
+                self._remove(key)
+                return None
+        self._touch(key)
+        self.used_keys.append(key)
+        return pickle.loads(blob)
+
+    def set(self, key, value, dependencies=()):
+        """Stores `value` for `key`. The value is discarded if one of the
+        `dependencies` files changes"""
+        entry = (
+            pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+            {x: get_mtime(x) for x in dependencies},
+        )
+        self.add_entries({key: entry})
+        self.new_entries[key] = entry
+
+    def take_new_entries(self):
+        """Returns the entries set since the last call, to hand them over to
+        another process"""
+        entries = self.new_entries
+        self.new_entries = {}
+        return entries
+
+    def take_used_keys(self):
+        """Returns the keys of the values read since the last call, to hand
+        them over to another process"""
+        keys = self.used_keys
+        self.used_keys = []
+        return keys
+
+    def mark_used(self, keys):
+        """Marks the values of `keys` as recently used"""
+        for key in keys:
+            if key in self.entries:
+                self._touch(key)
+
+    def _touch(self, key):
+        # The order is saved, so that eviction follows the use of entries
+        # across builds
+        if next(reversed(self.entries)) != key:
+            self.entries.move_to_end(key)
+            self.touched_keys.pop(key, None)
+            self.touched_keys[key] = None
+            self.order_dirty = True
+
+    def add_entries(self, entries):
+        for key, entry in entries.items():
+            self._remove(key)
+            self.entries[key] = entry
+            self.size += len(entry[0])
+        while self.size > self.max_size and self.entries:
+            self._remove(next(iter(self.entries)))
+        self.dirty = True
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[0])
+            self.touched_keys.pop(key, None)
+            self.dirty = True
@@ -8,11 +8,14 @@ The command line interface
 :license: BSD, see LICENSE for more details.
 """
 
+import argparse
+import json
+import logging
 import os
-import sys
 
 from rstblog.builder import Builder
 from rstblog.config import Config
+from rstblog.stats import DEFAULT_PROFILE_TOP
 
 
 def get_builder(project_folder):
@@ -28,21 +31,56 @@ def get_builder(project_folder):
 
 def main():
     """Entrypoint for the console script."""
-    if len(sys.argv) not in (1, 2, 3):
-        print("usage: rstblog <action> <folder>", file=sys.stderr)
-    if len(sys.argv) >= 2:
-        action = sys.argv[1]
-    else:
-        action = "build"
-    if len(sys.argv) >= 3:
-        folder = sys.argv[2]
-    else:
-        folder = os.getcwd()
-    if action not in ("build", "serve"):
-        print("unknown action", action, file=sys.stderr)
-    builder = get_builder(folder)
+    parser = argparse.ArgumentParser(prog="rstblog")
+    parser.add_argument(
+        "action", nargs="?", choices=("build", "serve"), default="build"
+    )
+    parser.add_argument("folder", nargs="?", default=os.getcwd())
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of processes used to build, 0 to use one per CPU",
+    )
+    parser.add_argument(
+        "--stats", action="store_true", help="print build statistics at the end"
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="print the wall and CPU time of each build step and the slowest"
+        " files at the end",
+    )
+    parser.add_argument(
+        "--profile-top",
+        type=int,
+        default=DEFAULT_PROFILE_TOP,
+        metavar="N",
+        help="number of slowest files printed by --profile (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--profile-output",
+        metavar="FILE",
+        help="with --profile, write the profile to FILE as a Chrome trace, which"
+        " can be loaded in chrome://tracing or Perfetto",
+    )
+    args = parser.parse_args()
+    builder = get_builder(args.folder)
+    builder.stats.profiling = args.profile
 
-    if action == "build":
-        builder.run()
+    if args.action == "build":
+        builder.run(jobs=args.jobs or os.cpu_count())
+        if args.stats:
+            for line in builder.stats.format():
+                print(line)
+        if args.profile:
+            for line in builder.stats.format_profile(args.profile_top):
+                print(line)
+            if args.profile_output:
+                with open(args.profile_output, "w") as f:
+                    json.dump(builder.stats.get_trace(), f)
     else:
+        # The server reports the changes it detects as info messages
+        logging.basicConfig(level=logging.INFO, format="%(message)s")
         builder.debug_serve()
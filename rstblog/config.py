@@ -8,20 +8,78 @@ Holds the configuration and can read it from another file.
 :license: BSD, see LICENSE for more details.
 """
 
+import os
+
 import yaml
 
 missing = object()
 
 
 class Config:
-    """A stacked config."""
-
-    def __init__(self):
-        self.stack = []
+    """A stacked config.
+
+    Each config holds one layer of settings on top of a parent config, so
+    adding a layer does not copy the layers below. Lookups fall back to a
+    flattened view of the parent, which is computed once and shared by all
+    its children.
+    """
+
+    def __init__(self, parent=None, layer=None):
+        self.parent = parent
+        self.layer = layer
+        #: the configuration files the layers have been loaded from
+        self.filenames = parent.filenames if parent is not None else []
+        #: the bottom layer, read by `root_get()`
+        self._root_layer = layer
+        if parent is not None and parent._root_layer is not None:
+            self._root_layer = parent._root_layer
+        self._flattened = None
+        self._prefix_index = None
+
+    @property
+    def stack(self):
+        """The layers of the config, from the bottom one to this one"""
+        stack = []
+        config = self
+        while config is not None:
+            if config.layer is not None:
+                stack.append(config.layer)
+            config = config.parent
+        stack.reverse()
+        return stack
+
+    def _get_flattened(self):
+        """Returns a dict of all settings, layers overriding the ones below"""
+        if self._flattened is None:
+            if self.parent is None:
+                flattened = {}
+            else:
+                flattened = dict(self.parent._get_flattened())
+            if self.layer is not None:
+                flattened.update(self.layer)
+            self._flattened = flattened
+        return self._flattened
+
+    def _get_prefix_index(self):
+        """Returns a dict mapping each prefix of the flattened keys to the
+        settings starting with that prefix"""
+        if self._prefix_index is None:
+            index = {}
+            for key, value in self._get_flattened().items():
+                prefix, _, _ = key.rpartition(".")
+                while prefix:
+                    index.setdefault(prefix, {})[key] = value
+                    prefix, _, _ = prefix.rpartition(".")
+            self._prefix_index = index
+        return self._prefix_index
 
     def __getitem__(self, key):
-        for layer in reversed(self.stack):
-            rv = layer.get(key, missing)
+        if self.layer is not None:
+            rv = self.layer.get(key, missing)
+            if rv is not missing:
+                return rv
+        if self.parent is not None:
+            rv = self.parent._get_flattened().get(key, missing)
             if rv is not missing:
                 return rv
         raise KeyError(key)
@@ -33,10 +91,13 @@ class Config:
             return default
 
     def list_entries(self, key):
-        rv = {}
-        prefix = key + "."
-        for layer in self.stack:
-            for key, value in layer.items():
+        if self.parent is None:
+            rv = {}
+        else:
+            rv = dict(self.parent._get_prefix_index().get(key, {}))
+        if self.layer is not None:
+            prefix = key + "."
+            for key, value in self.layer.items():
                 if key.startswith(prefix):
                     rv[key] = value
         return rv
@@ -47,7 +108,13 @@ class Config:
             rv = layer.get(key, missing)
             if rv is not missing:
                 if result is None:
-                    result = rv
+                    # Copy, so that merging does not modify the layers
+                    if isinstance(rv, list):
+                        result = list(rv)
+                    elif isinstance(rv, dict):
+                        result = dict(rv)
+                    else:
+                        result = rv
                 else:
                     if isinstance(result, list):
                         result.extend(rv)
@@ -58,15 +125,16 @@ class Config:
         return result
 
     def root_get(self, key, default=None):
-        return self.stack[0].get(key, default)
+        if self._root_layer is None:
+            return default
+        return self._root_layer.get(key, default)
 
     def add_from_dict(self, d):
         """Returns a new config from this config with another layer added
         from a given dictionary.
         """
         layer = {}
-        rv = Config()
-        rv.stack = self.stack + [layer]
+        rv = Config(self, layer)
 
         def _walk(d, prefix):
             for key, value in d.items():
@@ -87,7 +155,19 @@ class Config:
             return
         if not isinstance(d, dict):
             raise ValueError("Configuration has to contain a dict")
-        return self.add_from_dict(d)
+        rv = self.add_from_dict(d)
+        if hasattr(fd, "name"):
+            rv.filenames = self.filenames + [os.path.abspath(fd.name)]
+        return rv
 
-    def pop(self):
-        self.stack.pop()
+    def without_top_layer(self):
+        """Returns a config without the top layer of this one. This config is
+        not modified, since configs built on top of it depend on it."""
+        config = self
+        while config.layer is None:
+            if config.parent is None:
+                raise IndexError("config without layers")
+            config = config.parent
+        if config.parent is None:
+            return Config()
+        return config.parent
@@ -0,0 +1,196 @@
+"""
+rstblog.feeds
+~~~~~~~~~~~~~
+
+Atom and RSS 2.0 feeds. Feeds are written to the output file as they are
+generated, without building a document tree first.
+
+:copyright: (c) 2026 by Aurélien Gâteau.
+:license: BSD, see LICENSE for more details.
+"""
+
+import heapq
+import re
+from collections import namedtuple
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from urllib.parse import urljoin
+from xml.sax.saxutils import escape
+
+from rstblog.cache import make_key
+
+#: default number of entries in a feed
+DEFAULT_FEED_ENTRIES = 10
+
+XML_DECLARATION = "<?xml version='1.0' encoding='UTF-8'?>\n"
+
+#: characters which are not allowed in XML 1.0 documents
+INVALID_XML_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]")
+
+TEXT_ENTITIES = {"\r": "&#13;"}
+
+ATTRIBUTE_ENTITIES = {'"': "&quot;", "\n": "&#10;", "\r": "&#13;", "\t": "&#9;"}
+
+#: what a feed shows of a page
+FeedEntry = namedtuple(
+    "FeedEntry", ("id", "title", "link", "published", "updated", "terms", "content")
+)
+
+
+def _text(value):
+    return escape(INVALID_XML_CHARS.sub("", str(value)), TEXT_ENTITIES)
+
+
+def _attr(value):
+    return '"%s"' % escape(INVALID_XML_CHARS.sub("", str(value)), ATTRIBUTE_ENTITIES)
+
+
+def get_feed_size(builder):
+    """Returns the number of entries of the feeds"""
+    return builder.config.get("feed.entries", DEFAULT_FEED_ENTRIES)
+
+
+def get_feed_entries(builder, entries):
+    """Returns the entries which go into a feed, most recent first"""
+    return heapq.nlargest(get_feed_size(builder), entries, key=lambda x: x.pub_date)
+
+
+def get_feed_digest(builder, feed_path, title, entries, format="atom"):
+    """Returns a digest of what a feed is written from, besides the root
+    configuration"""
+    parts = [format, feed_path, title]
+    for entry in get_feed_entries(builder, entries):
+        parts.extend(
+            (
+                entry.slug,
+                entry.title,
+                entry.pub_date,
+                sorted(entry.tags),
+                entry.render_contents(),
+            )
+        )
+    return make_key(*parts)
+
+
+def get_feed_entry(builder, entry, url):
+    """Returns the FeedEntry of the `entry` context for a feed of the site at
+    `url`. It is computed once per build, since the same entry ends up in
+    several feeds."""
+    cache = builder.get_storage("feed_entries")
+    key = (entry, url)
+    rv = cache.get(key)
+    if rv is None:
+        entry_url = urljoin(url, entry.slug)
+        pub_date = entry.pub_date.astimezone()
+        rv = FeedEntry(
+            id=entry_url,
+            title=entry.title,
+            link=entry_url,
+            published=pub_date,
+            updated=pub_date,
+            terms=sorted(entry.tags),
+            content=entry.render_absolute_contents(url),
+        )
+        cache[key] = rv
+    return rv
+
+
+def write_atom_feed(f, builder, feed_path, title, entries):
+    """Writes an Atom feed of the most recent `entries` to the file `f`"""
+    url = builder.config.root_get("canonical_url") or "http://localhost/"
+    # Atom requires an author, fall back to the site itself
+    author = builder.config.root_get("author") or url
+    feed_url = urljoin(url, feed_path)
+    entries = get_feed_entries(builder, entries)
+
+    f.write(XML_DECLARATION)
+    f.write('<feed xmlns="http://www.w3.org/2005/Atom" xml:lang="en">\n')
+    f.write("  <id>%s</id>\n" % _text(feed_url))
+    f.write("  <title>%s</title>\n" % _text(title))
+    # Atom requires an update time, even for feeds without entries
+    if entries:
+        updated = entries[0].pub_date.astimezone()
+    else:
+        updated = datetime.now(timezone.utc)
+    f.write("  <updated>%s</updated>\n" % updated.isoformat())
+    f.write("  <author>\n    <name>%s</name>\n  </author>\n" % _text(author))
+    f.write("  <link href=%s/>\n" % _attr(url))
+    f.write('  <link href=%s rel="self"/>\n' % _attr(feed_url))
+    # Oldest entry first, like feedgen used to do
+    for entry in reversed(entries):
+        fields = get_feed_entry(builder, entry, url)
+        f.write("  <entry>\n")
+        f.write("    <id>%s</id>\n" % _text(fields.id))
+        f.write("    <title>%s</title>\n" % _text(fields.title))
+        f.write("    <updated>%s</updated>\n" % fields.updated.isoformat())
+        f.write("    <author>\n      <name>%s</name>\n    </author>\n" % _text(author))
+        f.write('    <content type="html">%s</content>\n' % _text(fields.content))
+        f.write('    <link href=%s rel="alternate"/>\n' % _attr(fields.link))
+        for term in fields.terms:
+            f.write("    <category term=%s/>\n" % _attr(term))
+        f.write("    <published>%s</published>\n" % fields.published.isoformat())
+        f.write("  </entry>\n")
+    f.write("</feed>\n")
+
+
+def write_rss_feed(f, builder, feed_path, title, entries):
+    """Writes an RSS 2.0 feed of the most recent `entries` to the file `f`"""
+    url = builder.config.root_get("canonical_url") or "http://localhost/"
+    feed_url = urljoin(url, feed_path)
+    entries = get_feed_entries(builder, entries)
+
+    f.write(XML_DECLARATION)
+    f.write('<rss xmlns:atom="http://www.w3.org/2005/Atom" version="2.0">\n')
+    f.write("  <channel>\n")
+    f.write("    <title>%s</title>\n" % _text(title))
+    f.write("    <link>%s</link>\n" % _text(url))
+    f.write("    <description>%s</description>\n" % _text(title))
+    f.write(
+        '    <atom:link href=%s rel="self" type="application/rss+xml"/>\n'
+        % _attr(feed_url)
+    )
+    f.write("    <language>en</language>\n")
+    if entries:
+        updated = format_datetime(entries[0].pub_date.astimezone())
+        f.write("    <lastBuildDate>%s</lastBuildDate>\n" % updated)
+    for entry in entries:
+        fields = get_feed_entry(builder, entry, url)
+        f.write("    <item>\n")
+        f.write("      <title>%s</title>\n" % _text(fields.title))
+        f.write("      <link>%s</link>\n" % _text(fields.link))
+        f.write("      <description>%s</description>\n" % _text(fields.content))
+        f.write('      <guid isPermaLink="true">%s</guid>\n' % _text(fields.id))
+        for term in fields.terms:
+            f.write("      <category>%s</category>\n" % _text(term))
+        pub_date = format_datetime(fields.published)
+        f.write("      <pubDate>%s</pubDate>\n" % pub_date)
+        f.write("    </item>\n")
+    f.write("  </channel>\n</rss>\n")
+
+
+#: feed writers for each feed format
+FEED_WRITERS = {
+    "atom": write_atom_feed,
+    "rss": write_rss_feed,
+}
+
+
+def get_feed_formats(builder):
+    """Returns the formats feeds are written in"""
+    if builder.config.get("feed.rss"):
+        return ["atom", "rss"]
+    return ["atom"]
+
+
+def write_feed_file(builder, format, _key, title, entries, **values):
+    """Writes the feed of the `_key` URL in `format`, unless it did not
+    change since the previous build"""
+    feed_path = builder.link_to(_key, **values)
+    writer = FEED_WRITERS[format]
+
+    def write(f):
+        writer(f, builder, feed_path, title, entries)
+
+    with builder.stats.measure("feeds"):
+        digest = get_feed_digest(builder, feed_path, title, entries, format)
+        builder.write_link_file_if_changed(_key, digest, write, **values)
@@ -0,0 +1,74 @@
+"""
+rstblog.highlight
+~~~~~~~~~~~~~~~~~
+
+Syntax highlighting with a persistent cache, shared by the code-block
+directive and Markdown code blocks.
+
+:copyright: (c) 2026 by Aurélien Gâteau.
+:license: BSD, see LICENSE for more details.
+"""
+
+import pygments
+from markdown.extensions import codehilite
+from pygments.lexers import get_lexer_by_name
+from pygments.util import ClassNotFound
+
+from rstblog.cache import make_key
+
+#: maps lexer names to lexers, or to None for unknown names
+_lexers = {}
+
+#: the RenderCache highlighted code is stored in
+_cache = None
+
+
+def get_lexer(name, **options):
+    """Like `pygments.lexers.get_lexer_by_name()`, but returns the same lexer
+    each time it is called with the same name and no options"""
+    if options:
+        return get_lexer_by_name(name, **options)
+    try:
+        lexer = _lexers[name]
+    except KeyError:
+        try:
+            lexer = get_lexer_by_name(name)
+        except ClassNotFound:
+            lexer = None
+        _lexers[name] = lexer
+    if lexer is None:
+        raise ClassNotFound("no lexer for alias %r found" % name)
+    return lexer
+
+
+def set_cache(cache):
+    global _cache
+    _cache = cache
+
+
+def highlight(code, lexer, formatter):
+    """Like `pygments.highlight()`, but the result is looked up in the cache
+    set with `set_cache()` first"""
+    if _cache is None:
+        return pygments.highlight(code, lexer, formatter)
+    key = make_key(
+        "highlight",
+        pygments.__version__,
+        type(lexer).__name__,
+        sorted(lexer.options.items()),
+        type(formatter).__name__,
+        sorted(formatter.options.items()),
+        code,
+    )
+    rv = _cache.get(key)
+    if rv is None:
+        rv = pygments.highlight(code, lexer, formatter)
+        _cache.set(key, rv)
+    return rv
+
+
+def install():
+    """Makes the Markdown codehilite extension use the cache and the lexers
+    of this module"""
+    codehilite.highlight = highlight
+    codehilite.get_lexer_by_name = get_lexer
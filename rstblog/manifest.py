@@ -0,0 +1,206 @@
+"""
+rstblog.manifest
+~~~~~~~~~~~~~~~~
+
+The build manifest remembers what the previous build extracted from each
+source file, so that unchanged files do not have to be parsed again.
+
+:copyright: (c) 2026 by Aurélien Gâteau.
+:license: BSD, see LICENSE for more details.
+"""
+
+import hashlib
+import os
+import pickle
+
+from rstblog import picklefile
+
+#: bump this when the format of the stored state changes
+MANIFEST_VERSION = 5
+
+MANIFEST_FILENAME = "manifest"
+
+
+def get_file_digest(*filenames):
+    """Returns a digest of the content of the given files. Files which do not
+    exist are skipped."""
+    digest = hashlib.sha1()
+    for filename in filenames:
+        try:
+            with open(filename, "rb") as f:
+                content = f.read()
+        except FileNotFoundError:
+            continue
+        digest.update(filename.encode("utf-8"))
+        digest.update(content)
+    return digest.hexdigest()
+
+
+def get_mtime(filename):
+    """Returns the modification time of `filename`, or None if it does not
+    exist"""
+    try:
+        return os.path.getmtime(filename)
+    except FileNotFoundError:
+        return None
+
+
+class Manifest:
+    """Maps source filenames to the state their program prepared from them,
+    and to the files their output depends on. Also remembers the digest of
+    what generated files, like tag pages, have been rendered from.
+
+    States are stored pickled, so that a state handed out by `get()` can be
+    modified by the caller without altering what gets saved.
+    """
+
+    def __init__(self, filename, salt=""):
+        self.filename = filename
+        self.salt = "%d:%s" % (MANIFEST_VERSION, salt)
+        self.entries = {}
+        self.seen = set()
+        self.outputs = {}
+        self.seen_outputs = set()
+        self.dirty = False
+
+    def load(self):
+        self.entries = {}
+        self.seen = set()
+        self.outputs = {}
+        self.seen_outputs = set()
+        self.dirty = False
+        data = picklefile.load(self.filename, self.salt, "manifest")
+        if data is not None:
+            self.entries, self.outputs = data
+
+    def save(self):
+        # Forget about files which have not been seen during this build: they
+        # have been removed or are now ignored
+        entries = {x: y for x, y in self.entries.items() if x in self.seen}
+        outputs = {x: y for x, y in self.outputs.items() if x in self.seen_outputs}
+        if (
+            not self.dirty
+            and len(entries) == len(self.entries)
+            and len(outputs) == len(self.outputs)
+        ):
+            return
+        picklefile.save(self.filename, self.salt, (entries, outputs))
+        self.dirty = False
+
+    def _get_or_create_entry(self, source_filename):
+        self.seen.add(source_filename)
+        entry = self.entries.get(source_filename)
+        if entry is None:
+            entry = self.entries[source_filename] = {
+                "digest": None,
+                "state": None,
+                "inputs": {},
+                "built": None,
+            }
+        self.dirty = True
+        return entry
+
+    def get(self, source_filename, digest):
+        """Returns the state stored for `source_filename`, or None if there is
+        none, if it was stored for a different digest or if one of the files
+        read to prepare it changed"""
+        self.seen.add(source_filename)
+        entry = self.entries.get(source_filename)
+        if entry is None or entry["digest"] != digest:
+            return None
+        for filename, mtime in entry["inputs"].items():
+            if get_mtime(filename) != mtime:
+                return None
+        return pickle.loads(entry["state"])
+
+    def get_state(self, source_filename):
+        """Returns the state stored for `source_filename` without checking
+        whether it is up to date, or None. Used to restore the state another
+        process just prepared."""
+        entry = self.entries.get(source_filename)
+        if entry is None or entry["state"] is None:
+            return None
+        return pickle.loads(entry["state"])
+
+    def get_digest(self, source_filename):
+        """Returns the digest of `source_filename` when its state was stored,
+        or None"""
+        entry = self.entries.get(source_filename)
+        if entry is None:
+            return None
+        return entry["digest"]
+
+    def get_used_files(self):
+        """Returns the set of the files the previous builds have read, besides
+        the source files"""
+        rv = set()
+        for entry in self.entries.values():
+            rv.update(entry["inputs"])
+            rv.update(entry["built"] or ())
+        for output in self.outputs.values():
+            rv.update(output["dependencies"])
+        return rv
+
+    def put(self, source_filename, digest, state, inputs=()):
+        """Stores the state prepared from `source_filename`. `inputs` are the
+        files which have been read to prepare it, besides the source file"""
+        entry = self._get_or_create_entry(source_filename)
+        entry["digest"] = digest
+        entry["state"] = pickle.dumps(state, pickle.HIGHEST_PROTOCOL)
+        entry["inputs"] = {x: get_mtime(x) for x in inputs}
+
+    def get_entry(self, source_filename):
+        """Returns the raw entry for `source_filename`, to hand it over to
+        another process"""
+        return self.entries.get(source_filename)
+
+    def set_entry(self, source_filename, entry):
+        self.seen.add(source_filename)
+        self.entries[source_filename] = entry
+        self.dirty = True
+
+    def get_built(self, source_filename):
+        """Returns a dict mapping the files the output of `source_filename`
+        has last been built from to their modification time then, or None if
+        it has not been built yet"""
+        self.seen.add(source_filename)
+        entry = self.entries.get(source_filename)
+        if entry is None:
+            return None
+        return entry["built"]
+
+    def set_built(self, source_filename, sources, dependencies):
+        """Stores that `source_filename` has been built. `sources` maps its
+        source files to their modification time when the build started. The
+        modification times of `dependencies` and of the inputs are read now,
+        since the build may have generated them."""
+        entry = self._get_or_create_entry(source_filename)
+        built = {x: get_mtime(x) for x in set(dependencies).union(entry["inputs"])}
+        built.update(sources)
+        entry["built"] = built
+
+    def is_output_up_to_date(self, filename, digest):
+        """Returns True if the generated file `filename` has been written by a
+        previous build from the same `digest`, and neither it nor the files it
+        depended on changed since"""
+        self.seen_outputs.add(filename)
+        output = self.outputs.get(filename)
+        if output is None or output["digest"] != digest:
+            return False
+        if get_mtime(filename) != output["mtime"]:
+            return False
+        for dependency, mtime in output["dependencies"].items():
+            if get_mtime(dependency) != mtime:
+                return False
+        return True
+
+    def set_output(self, filename, digest, dependencies=()):
+        """Stores the digest of what the generated file `filename` has just
+        been written from, and the files it depends on, like templates"""
+        self.seen_outputs.add(filename)
+        self.dirty = True
+        self.outputs[filename] = {
+            "digest": digest,
+            "mtime": get_mtime(filename),
+            "dependencies": {x: get_mtime(x) for x in dependencies},
+        }
@@ -12,8 +12,16 @@ from datetime import datetime
 
 from werkzeug.routing import Map, NotFound, Rule
 
+from rstblog.cache import make_key
+from rstblog.feeds import get_feed_formats, write_feed_file
 from rstblog.signals import after_file_published, before_build_finished
-from rstblog.utils import generate_feed_str
+from rstblog.utils import get_entries_digest
+
+#: URL keys of the blog feeds for each feed format
+FEED_URL_KEYS = {
+    "atom": "blog_feed",
+    "rss": "blog_rss_feed",
+}
 
 
 class YearArchive:
@@ -21,6 +29,9 @@ class YearArchive:
         self.year = year
         self.entries = sorted(entries, key=lambda x: x.pub_date, reverse=True)
         self.count = len(entries)
+        #: changes when what the archive pages can show of the entries of this
+        #: year changes, including their summary, see `get_entries_digest()`
+        self.digest = get_entries_digest(self.entries, "year", year)
 
 
 def test_pattern(path, pattern):
@@ -68,31 +79,42 @@ def get_archive_summary(builder) -> list[YearArchive]:
 
 
 def write_archive_pages(builder):
+    """Writes the archive pages whose content changed"""
     archive = get_archive_summary(builder)
-    with builder.open_link_file("blog_archive") as f:
+
+    def write_archive(f):
         rv = builder.render_template("blog/archive.html", {"archive": archive})
         f.write(rv + "\n")
 
+    digest = make_key("archive", *[x.digest for x in archive])
+    builder.write_link_file_if_changed("blog_archive", digest, write_archive)
+
     for year_archive in archive:
-        with builder.open_link_file("blog_year_archive", year=year_archive.year) as f:
+
+        def write_year_archive(f):
             rv = builder.render_template(
                 "blog/year_archive.html", {"entry": year_archive}
             )
             f.write(rv + "\n")
 
+        builder.write_link_file_if_changed(
+            "blog_year_archive",
+            year_archive.digest,
+            write_year_archive,
+            year=year_archive.year,
+        )
+
 
-def write_feed(builder):
+def write_feeds(builder):
     title = builder.config.get("feed.name") or "Recent Blog Posts"
     entries = get_all_entries(builder)
-    feed_path = builder.link_to("blog_feed")
-    feed_str = generate_feed_str(builder, feed_path, title, entries)
-    with builder.open_link_file("blog_feed") as f:
-        f.write(feed_str)
+    for format in get_feed_formats(builder):
+        write_feed_file(builder, format, FEED_URL_KEYS[format], title, entries)
 
 
 def write_blog_files(builder):
     write_archive_pages(builder)
-    write_feed(builder)
+    write_feeds(builder)
 
 
 def setup(builder):
@@ -111,3 +133,8 @@ def setup(builder):
     builder.register_url(
         "blog_feed", config_key="modules.blog.feed_url", config_default="/feed.atom"
     )
+    builder.register_url(
+        "blog_rss_feed",
+        config_key="modules.blog.rss_feed_url",
+        config_default="/feed.rss",
+    )
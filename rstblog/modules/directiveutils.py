@@ -10,7 +10,35 @@ Utilities to work with RST directives
 
 import os
 
+#: Jinja template of the <source> elements of a <picture>, rendered from a
+#: `sources` list of (MIME type, srcset). They are closed explicitly: lxml,
+#: which post-processes Markdown output, does not know they are void elements
+#: and would nest the <img> in them.
+SOURCES_TEMPLATE = (
+    "{% for type, srcset in sources %}"
+    '<source type="{{ type }}" srcset="{{ srcset|escape }}"></source>'
+    "{% endfor %}"
+)
+
+
+def get_context(directive):
+    return directive.state.document.settings.rstblog_context
+
 
 def get_document_dirname(directive):
-    context = directive.state.document.settings.rstblog_context
+    context = get_context(directive)
     return os.path.dirname(context.full_source_filename)
+
+
+def get_thumbnail_generator(directive):
+    return get_context(directive).builder.thumbnails
+
+
+def measure(directive, name):
+    """Returns a context manager measuring a step of the build"""
+    return get_context(directive).builder.stats.measure(name)
+
+
+def add_dependency(directive, path):
+    """Records that the output of the document depends on the file at `path`"""
+    get_context(directive).add_dependency(os.path.abspath(path))
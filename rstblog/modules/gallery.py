@@ -15,24 +15,37 @@ from docutils import nodes
 from docutils.parsers.rst import Directive, directives
 from jinja2 import Template
 
-from rstblog import utils
 from rstblog.modules import directiveutils
 
 DEFAULT_THUMB_SIZE = 200
 
-TEMPLATE = """
+TEMPLATE = (
+    """
 <ul class="thumbnails center" style="clear: both">
 {% for item in images %}
     <li><a class="reference external image-reference" href="{{ item.full }}" title="{{ item.alt|escape }}"
-        ><img
+        >{% if item.sources %}<picture>{% with sources = item.sources %}"""
+    + directiveutils.SOURCES_TEMPLATE
+    + """{% endwith %}{% endif %}<img
             width="{{ item.thumbnail_width }}"
             height="{{ item.thumbnail_height }}"
             alt="{{ item.alt|escape }}"
-            src="{{ item.thumbnail }}"
-        ></a></li>
+            src="{{ item.thumbnail }}"{% if item.srcset %}
+            srcset="{{ item.srcset|escape }}"{% endif %}
+        >{% if item.sources %}</picture>{% endif %}</a></li>
 {% endfor %}
 </ul>
 """
+)
+
+_template = None
+
+
+def get_template():
+    global _template
+    if _template is None:
+        _template = Template(TEMPLATE)
+    return _template
 
 
 class Gallery(Directive):
@@ -47,10 +60,6 @@ class Gallery(Directive):
     optional_arguments = 0
     final_argument_whitespace = False
 
-    def __init__(self, *args, **kwargs):
-        Directive.__init__(self, *args, **kwargs)
-        self.template = Template(TEMPLATE)
-
     def run(self):
         size = self.options.get("thumbsize", DEFAULT_THUMB_SIZE)
         square = "square" in self.options
@@ -58,6 +67,7 @@ class Gallery(Directive):
         if "images" in self.options:
             image_name = self.options.get("images")
             image_path = Path(directiveutils.get_document_dirname(self), image_name)
+            directiveutils.add_dependency(self, image_path)
             with open(image_path) as f:
                 yaml_content = f.read()
         else:
@@ -65,15 +75,25 @@ class Gallery(Directive):
         images = yaml.load(yaml_content, yaml.SafeLoader)
 
         base_path = directiveutils.get_document_dirname(self)
-        for image in images:
-            thumbnail = utils.generate_thumbnail(
-                base_path, image["full"], size, square=square
-            )
+        generator = directiveutils.get_thumbnail_generator(self)
+        # Submit all thumbnails first, so that they are generated in parallel
+        with directiveutils.measure(self, "thumbnails"):
+            futures = [
+                generator.submit(base_path, x["full"], size, square=square)
+                for x in images
+            ]
+            thumbnails = [x.result() for x in futures]
+        for image, thumbnail in zip(images, thumbnails):
+            directiveutils.add_dependency(self, Path(base_path, image["full"]))
+            for variant in thumbnail.variants:
+                directiveutils.add_dependency(self, Path(base_path, variant.relpath))
             image["thumbnail"] = thumbnail.relpath
             image["thumbnail_width"] = thumbnail.width
             image["thumbnail_height"] = thumbnail.height
+            image["srcset"] = thumbnail.srcset
+            image["sources"] = thumbnail.sources
 
-        html = self.template.render(images=images)
+        html = get_template().render(images=images)
         return [nodes.raw("", html, format="html")]
 
 
@@ -8,15 +8,19 @@ Adds support for pygments.
 :license: BSD, see LICENSE for more details.
 """
 
+import pygments
 from docutils import nodes
 from docutils.parsers.rst import Directive, directives
-from pygments import highlight
 from pygments.formatters import HtmlFormatter
-from pygments.lexers import TextLexer, get_lexer_by_name
+from pygments.lexers import TextLexer
 from pygments.styles import get_style_by_name
 
+from rstblog.cache import make_key
+from rstblog.highlight import get_lexer, highlight
 from rstblog.signals import before_build_finished, before_file_processed
 
+STYLESHEET_FILENAME = "_pygments.css"
+
 html_formatter = None
 
 
@@ -28,7 +32,7 @@ class CodeBlock(Directive):
 
     def run(self):
         try:
-            lexer = get_lexer_by_name(self.arguments[0])
+            lexer = get_lexer(self.arguments[0])
         except ValueError:
             lexer = TextLexer()
         code = "\n".join(self.content)
@@ -37,12 +41,21 @@ class CodeBlock(Directive):
 
 
 def inject_stylesheet(context, **kwargs):
-    context.add_stylesheet("_pygments.css")
+    context.add_stylesheet(STYLESHEET_FILENAME)
 
 
 def write_stylesheet(builder, **kwargs):
-    with builder.open_static_file("_pygments.css", "w") as f:
+    """Writes the stylesheet, unless it has been written for the same style
+    by a previous build"""
+    filename = builder.get_full_static_filename(STYLESHEET_FILENAME)
+    digest = make_key(
+        "pygments", pygments.__version__, sorted(html_formatter.options.items())
+    )
+    if builder.manifest.is_output_up_to_date(filename, digest):
+        return
+    with builder.open_static_file(STYLESHEET_FILENAME, "w") as f:
         f.write(html_formatter.get_style_defs())
+    builder.manifest.set_output(filename, digest)
 
 
 def setup(builder):
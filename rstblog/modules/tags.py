@@ -10,8 +10,16 @@ Implements tagging.
 
 from jinja2 import pass_context
 
+from rstblog.cache import make_key
+from rstblog.feeds import get_feed_formats, write_feed_file
 from rstblog.signals import after_file_published, before_build_finished
-from rstblog.utils import generate_feed_str
+from rstblog.utils import get_entries_digest
+
+#: URL keys of the tag feeds for each feed format
+FEED_URL_KEYS = {
+    "atom": "tagfeed",
+    "rss": "tagrssfeed",
+}
 
 
 class Tag:
@@ -58,33 +66,40 @@ def remember_tags(context):
 
 
 def write_tags_page(builder):
-    with builder.open_link_file("tags") as f:
-        rv = builder.render_template("tags.html")
-        f.write(rv + "\n")
+    def write(f):
+        f.write(builder.render_template("tags.html") + "\n")
 
+    tags = sorted((x.name, x.count) for x in get_tag_summary(builder))
+    builder.write_link_file_if_changed("tags", make_key("tags", *tags), write)
 
-def write_tag_feed(builder, tag):
+
+def write_tag_feeds(builder, tag):
     title = f"Posts tagged {tag.name}"
     entries = get_tagged_entries(builder, tag)
-    feed_path = builder.link_to("tagfeed", tag=tag.name)
-    feed_str = generate_feed_str(builder, feed_path, title, entries)
-    with builder.open_link_file("tagfeed", tag=tag.name) as f:
-        f.write(feed_str)
+    for format in get_feed_formats(builder):
+        write_feed_file(
+            builder, format, FEED_URL_KEYS[format], title, entries, tag=tag.name
+        )
 
 
 def write_tag_page(builder, tag):
     entries = get_tagged_entries(builder, tag)
     entries.sort(key=lambda x: x.pub_date, reverse=True)
-    with builder.open_link_file("tag", tag=tag.name) as f:
+
+    def write(f):
         rv = builder.render_template("tag.html", {"tag": tag, "entries": entries})
         f.write(rv + "\n")
 
+    digest = get_entries_digest(entries, "tag", tag.name)
+    builder.write_link_file_if_changed("tag", digest, write, tag=tag.name)
+
 
 def write_tag_files(builder):
+    """Writes the tag pages and feeds whose content changed"""
     write_tags_page(builder)
     for tag in get_tag_summary(builder):
         write_tag_page(builder, tag)
-        write_tag_feed(builder, tag)
+        write_tag_feeds(builder, tag)
 
 
 def setup(builder):
@@ -98,6 +113,11 @@ def setup(builder):
         config_key="modules.tags.tag_feed_url",
         config_default="/tags/<tag>/feed.atom",
     )
+    builder.register_url(
+        "tagrssfeed",
+        config_key="modules.tags.tag_rss_feed_url",
+        config_default="/tags/<tag>/feed.rss",
+    )
     builder.register_url(
         "tags", config_key="modules.tags.tags_url", config_default="/tags/"
     )
@@ -8,14 +8,76 @@ An image tag with automatic thumbnails
 :license: BSD, see LICENSE for more details.
 """
 
+import os
+import re
+
+from docutils import nodes
 from docutils.parsers.rst import directives
 from docutils.parsers.rst.directives.images import Image
+from jinja2 import Template
 
-from rstblog import utils
 from rstblog.modules import directiveutils
 
 DEFAULT_THUMB_SIZE = 300
 
+PICTURE_TEMPLATE = (
+    """
+<a class="reference external image-reference" href="{{ target|escape }}"><picture>
+    {%- with sources = thumbnail.sources %}"""
+    + directiveutils.SOURCES_TEMPLATE
+    + """{% endwith %}
+    <img
+        alt="{{ alt|escape }}"
+        {%- if classes %}
+        class="{{ classes|escape }}"
+        {%- endif %}
+        {%- if style %}
+        style="{{ style|escape }}"
+        {%- endif %}
+        width="{{ thumbnail.width }}"
+        height="{{ thumbnail.height }}"
+        src="{{ thumbnail.relpath|escape }}"
+        {%- if thumbnail.srcset %}
+        srcset="{{ thumbnail.srcset|escape }}"
+        {%- endif %}
+    ></picture></a>
+"""
+)
+
+_template = None
+
+
+def get_template():
+    global _template
+    if _template is None:
+        _template = Template(PICTURE_TEMPLATE)
+    return _template
+
+
+def get_size_style(options, width, height):
+    """Returns the style attribute setting the size given by the :width:,
+    :height: and :scale: options, like docutils does for images. `width` and
+    `height` are the size of the thumbnail."""
+    size = [options.get("width"), options.get("height")]
+    if "scale" in options:
+        size = [x or "%dpx" % y for x, y in zip(size, (width, height))]
+        factor = options["scale"] / 100
+        for i, value in enumerate(size):
+            match = re.match(r"([0-9.]+)(\S*)$", value)
+            size[i] = "%s%s" % (factor * float(match.group(1)), match.group(2))
+    if not any(size):
+        return ""
+    declarations = []
+    for name, value in zip(("width", "height"), size):
+        if not value:
+            # Override the size attribute of the <img>, to keep its ratio
+            value = "auto"
+        elif re.match(r"^[0-9.]+$", value):
+            # Unitless values are pixels
+            value += "px"
+        declarations.append("%s: %s;" % (name, value))
+    return " ".join(declarations)
+
 
 class ThumbImg(Image):
     option_spec = dict(Image.option_spec, **{"thumbsize": directives.nonnegative_int})
@@ -25,12 +87,42 @@ class ThumbImg(Image):
 
         big_filename = directives.uri(self.arguments[0])
         document_dirname = directiveutils.get_document_dirname(self)
-        thumbnail = utils.generate_thumbnail(document_dirname, big_filename, size)
+        directiveutils.add_dependency(
+            self, os.path.join(document_dirname, big_filename)
+        )
+        generator = directiveutils.get_thumbnail_generator(self)
+        with directiveutils.measure(self, "thumbnails"):
+            thumbnail = generator.generate(document_dirname, big_filename, size)
+        for variant in thumbnail.variants:
+            directiveutils.add_dependency(
+                self, os.path.join(document_dirname, variant.relpath)
+            )
+
+        if len(thumbnail.variants) > 1:
+            return self.run_picture(big_filename, thumbnail)
 
         self.arguments[0] = thumbnail.relpath
         self.options["target"] = big_filename
         return super().run()
 
+    def run_picture(self, big_filename, thumbnail):
+        """Emits a <picture> offering all the variants of the thumbnail, which
+        the docutils image node cannot do"""
+        classes = list(self.options.get("class", []))
+        if "align" in self.options:
+            classes.append("align-" + self.options["align"])
+        html = get_template().render(
+            target=big_filename,
+            thumbnail=thumbnail,
+            alt=self.options.get("alt", thumbnail.relpath),
+            classes=" ".join(classes),
+            style=get_size_style(self.options, thumbnail.width, thumbnail.height),
+        )
+        # Jinja drops the trailing newline of the template, end the fragment
+        # with a blank line so that Markdown does not merge the next paragraph
+        # into it
+        return [nodes.raw("", html + "\n\n", format="html")]
+
 
 def setup(builder):
     directives.register_directive("thumbimg", ThumbImg)
@@ -0,0 +1,212 @@
+"""
+rstblog.output
+~~~~~~~~~~~~~~
+
+Writes output files atomically, and only when their content changed, so that
+unchanged files keep their modification time and readers never see a
+half-written file.
+
+:copyright: (c) 2026 by Aurélien Gâteau.
+:license: BSD, see LICENSE for more details.
+"""
+
+import errno
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, reflinks fall back to copies there
+    fcntl = None
+
+logger = logging
+
+# Temporary files are created with restrictive permissions, give them the ones
+# open() would have given
+_umask = os.umask(0)
+os.umask(_umask)
+FILE_MODE = 0o666 & ~_umask
+
+#: ioctl cloning a file on file systems supporting it, from <linux/fs.h>
+FICLONE = 0x40049409
+
+#: ways `OutputWriter.copy()` can put a file in the output folder
+COPY_STRATEGIES = ("copy", "hardlink", "reflink", "symlink")
+
+
+def get_content_digest(filename):
+    """Returns a digest of the content of `filename`"""
+    digest = hashlib.sha1()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def has_same_content(filename1, filename2):
+    """Returns True if both files exist and have the same content"""
+    try:
+        if os.path.getsize(filename1) != os.path.getsize(filename2):
+            return False
+    except FileNotFoundError:
+        return False
+    return get_content_digest(filename1) == get_content_digest(filename2)
+
+
+def _make_tmp_file(filename):
+    """Creates a temporary file next to `filename`, returns its descriptor
+    and its path"""
+    folder = os.path.dirname(filename)
+    os.makedirs(folder, exist_ok=True)
+    return tempfile.mkstemp(
+        dir=folder, prefix="." + os.path.basename(filename), suffix=".tmp"
+    )
+
+
+def _copy_data(src, dst):
+    """Copies the content of the file `src` to the file `dst`, sharing data
+    blocks between them if the file system supports it"""
+    with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+        if fcntl is not None:
+            try:
+                fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+                return
+            except OSError:
+                pass
+        # copy_file_range() lets the file system share blocks or copy them
+        # without going through user space
+        size = os.fstat(src_file.fileno()).st_size
+        copied = 0
+        try:
+            while copied < size:
+                n = os.copy_file_range(
+                    src_file.fileno(), dst_file.fileno(), size - copied
+                )
+                if n == 0:
+                    break
+                copied += n
+            if copied == size:
+                return
+        except (AttributeError, OSError):
+            pass
+        src_file.seek(0)
+        dst_file.seek(0)
+        dst_file.truncate()
+        shutil.copyfileobj(src_file, dst_file)
+
+
+class OutputWriter:
+    """Writes output files, counting the bytes written, the bytes linked and
+    the bytes of the files whose content did not change in `stats`.
+
+    `copy_strategy` tells how `copy()` puts files in the output folder:
+    "copy" copies them, "hardlink" and "symlink" link to the source files,
+    and "reflink" makes copies sharing their data blocks with the source
+    files. Strategies which are not possible fall back to copying.
+    """
+
+    def __init__(self, stats, copy_strategy="copy"):
+        if copy_strategy not in COPY_STRATEGIES:
+            raise ValueError(
+                "unknown copy strategy %r, expected one of: %s"
+                % (copy_strategy, ", ".join(COPY_STRATEGIES))
+            )
+        self.stats = stats
+        self.copy_strategy = copy_strategy
+
+    @contextmanager
+    def open(self, filename, mode="w"):
+        """Returns a file to write the content of `filename` to. It replaces
+        `filename` when closed, if its content changed."""
+        fd, tmp_filename = _make_tmp_file(filename)
+        try:
+            with os.fdopen(fd, mode) as f:
+                yield f
+        except BaseException:
+            os.unlink(tmp_filename)
+            raise
+        self.commit(tmp_filename, filename)
+
+    def commit(self, tmp_filename, filename):
+        """Replaces `filename` with `tmp_filename` if their content differ,
+        removes `tmp_filename` otherwise"""
+        size = os.path.getsize(tmp_filename)
+        if has_same_content(tmp_filename, filename):
+            os.unlink(tmp_filename)
+            self.stats.count("output bytes unchanged", size)
+            return
+        os.chmod(tmp_filename, FILE_MODE)
+        os.replace(tmp_filename, filename)
+        self.stats.count("output bytes written", size)
+
+    def copy(self, src, dst):
+        """Puts `src` at `dst` according to the copy strategy, unless `dst`
+        is already up to date"""
+        if self.copy_strategy == "hardlink":
+            if self._is_same_file(src, dst):
+                self.stats.count("output bytes unchanged", os.path.getsize(dst))
+                return
+            if self._link(os.link, src, dst):
+                return
+        elif self.copy_strategy == "symlink":
+            src = os.path.abspath(src)
+            if os.path.islink(dst) and os.readlink(dst) == src:
+                self.stats.count("output bytes unchanged", os.path.getsize(dst))
+                return
+            if self._link(os.symlink, src, dst):
+                return
+
+        # Links left by another strategy must be replaced by copies
+        if (
+            has_same_content(src, dst)
+            and not os.path.islink(dst)
+            and not self._is_same_file(src, dst)
+        ):
+            self.stats.count("output bytes unchanged", os.path.getsize(dst))
+            return
+        fd, tmp_filename = _make_tmp_file(dst)
+        os.close(fd)
+        try:
+            if self.copy_strategy == "reflink":
+                _copy_data(src, tmp_filename)
+            else:
+                shutil.copyfile(src, tmp_filename)
+            shutil.copymode(src, tmp_filename)
+        except BaseException:
+            os.unlink(tmp_filename)
+            raise
+        os.replace(tmp_filename, dst)
+        self.stats.count("output bytes written", os.path.getsize(dst))
+
+    def _is_same_file(self, src, dst):
+        try:
+            return os.path.samefile(src, dst) and not os.path.islink(dst)
+        except FileNotFoundError:
+            return False
+
+    def _link(self, link, src, dst):
+        """Replaces `dst` with a link to `src` created by `link()`. Returns
+        False if the link cannot be created."""
+        fd, tmp_filename = _make_tmp_file(dst)
+        os.close(fd)
+        os.unlink(tmp_filename)
+        try:
+            link(src, tmp_filename)
+        except OSError as exc:
+            if exc.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                raise
+            logger.warning(
+                "Cannot link %s (%s), copying files instead of linking them",
+                src,
+                exc,
+            )
+            self.copy_strategy = "copy"
+            return False
+        os.replace(tmp_filename, dst)
+        self.stats.count("output bytes linked", os.path.getsize(dst))
+        return True
@@ -0,0 +1,42 @@
+"""
+rstblog.picklefile
+~~~~~~~~~~~~~~~~~~
+
+Versioned pickle files, used to keep the manifest, the render cache and the
+thumbnail index between builds.
+
+:copyright: (c) 2026 by Aurélien Gâteau.
+:license: BSD, see LICENSE for more details.
+"""
+
+import logging
+import os
+import pickle
+
+logger = logging
+
+
+def load(filename, version, description="file"):
+    """Returns the data saved to `filename` by `save()` with the same
+    `version`, or None if the file does not exist, cannot be read or has been
+    saved with another version"""
+    try:
+        with open(filename, "rb") as f:
+            data = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as exc:
+        logger.warning("Ignoring unreadable %s %s: %s", description, filename, exc)
+        return None
+    if not isinstance(data, tuple) or len(data) != 2 or data[0] != version:
+        return None
+    return data[1]
+
+
+def save(filename, version, data):
+    """Saves `data` to `filename`, replacing it atomically"""
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    tmp_filename = filename + ".tmp"
+    with open(tmp_filename, "wb") as f:
+        pickle.dump((version, data), f, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_filename, filename)
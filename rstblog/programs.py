@@ -9,7 +9,7 @@ Builtin build programs.
 """
 
 import os
-import shutil
+import re
 import subprocess
 from datetime import datetime
 from io import StringIO
@@ -21,12 +21,14 @@ import yaml
 from jinja2 import Template
 from markupsafe import Markup
 
-from rstblog.utils import (
-    fix_relative_url,
-    fix_relative_urls,
-    get_html_summary,
-    get_og_properties,
-)
+try:
+    import sass
+except ImportError:
+    sass = None
+
+from rstblog.cache import make_key
+from rstblog.manifest import get_file_digest
+from rstblog.utils import fix_relative_url, process_html
 
 MARKDOWN_EXTENSIONS = {
     "tables": {},
@@ -38,8 +40,32 @@ MARKDOWN_EXTENSIONS = {
 
 HEADER_LIMIT = "---"
 
+#: matches the list of names of a Sass @import rule
+SCSS_IMPORT_RE = re.compile(r"@(?:import|use|forward)\s+([^;]+);")
+
+SCSS_IMPORT_NAME_RE = re.compile(r"[\"']([^\"']+)[\"']")
+
+# Loading the Markdown extensions is slow, so each process reuses a single
+# converter, reset between documents
+_markdown_converter = None
+
+
+def get_markdown_converter(stats):
+    global _markdown_converter
+    if _markdown_converter is None:
+        with stats.measure("markdown extensions setup"):
+            _markdown_converter = markdown.Markdown(
+                extensions=MARKDOWN_EXTENSIONS.keys(),
+                extension_configs=MARKDOWN_EXTENSIONS,
+            )
+    return _markdown_converter
+
 
 class Program:
+    #: set to True if `prepare()` is worth running in a worker process during
+    #: parallel builds
+    parallel_prepare = False
+
     def __init__(self, context):
         self._context = ref(context)
 
@@ -73,8 +99,7 @@ class CopyProgram(Program):
     """A program that copies a file over unchanged"""
 
     def run(self):
-        os.makedirs(self.context.destination_folder, exist_ok=True)
-        shutil.copy(
+        self.context.builder.output.copy(
             self.context.full_source_filename, self.context.full_destination_filename
         )
 
@@ -82,21 +107,78 @@ class CopyProgram(Program):
         return self.context.source_filename
 
 
+def find_scss_import(dirname, name):
+    """Returns the path of the file `@import "name"` refers to in a
+    stylesheet of `dirname`, or None"""
+    folder, basename = os.path.split(os.path.join(dirname, name))
+    if os.path.splitext(basename)[1] in (".scss", ".sass"):
+        candidates = [basename, "_" + basename]
+    else:
+        candidates = [
+            prefix + basename + ext
+            for prefix in ("", "_")
+            for ext in (".scss", ".sass", ".css")
+        ]
+        candidates += [
+            os.path.join(basename, "_index.scss"),
+            os.path.join(basename, "index.scss"),
+        ]
+    for candidate in candidates:
+        path = os.path.join(folder, candidate)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def get_scss_imports(filename, imports=None):
+    """Returns the set of files imported by the stylesheet `filename`,
+    directly or not"""
+    if imports is None:
+        imports = set()
+    with open(filename, encoding="utf-8") as f:
+        source = f.read()
+    dirname = os.path.dirname(filename)
+    for match in SCSS_IMPORT_RE.finditer(source):
+        for name in SCSS_IMPORT_NAME_RE.findall(match.group(1)):
+            # Plain CSS imports are left to the browser
+            if name.endswith(".css") or "://" in name:
+                continue
+            path = find_scss_import(dirname, name)
+            if path is not None and path not in imports:
+                imports.add(path)
+                get_scss_imports(path, imports)
+    return imports
+
+
 class SCSSProgram(Program):
-    """A program that processes an SCSS file"""
+    """A program that processes an SCSS file. It is compiled in-process with
+    libsass if it is installed, by running sassc otherwise."""
 
     def run(self):
-        os.makedirs(self.context.destination_folder, exist_ok=True)
-        subprocess.check_call(
-            [
-                "sassc",
-                "--sourcemap",
-                "-t",
-                "compact",
-                self.context.full_source_filename,
-                self.context.full_destination_filename,
-            ]
+        src = self.context.full_source_filename
+        dst = self.context.full_destination_filename
+        for path in get_scss_imports(src):
+            self.context.add_dependency(path)
+        if sass is None:
+            self.run_sassc(src, dst)
+            return
+
+        map_filename = dst + ".map"
+        css, source_map = sass.compile(
+            filename=src,
+            output_style="compact",
+            source_map_filename=map_filename,
+            output_filename_hint=dst,
         )
+        output = self.context.builder.output
+        with output.open(dst) as f:
+            f.write(css)
+        with output.open(map_filename) as f:
+            f.write(source_map)
+
+    def run_sassc(self, src, dst):
+        os.makedirs(self.context.destination_folder, exist_ok=True)
+        subprocess.check_call(["sassc", "--sourcemap", "-t", "compact", src, dst])
 
     def get_desired_filename(self):
         return self.context.source_filename.replace("scss", "css")
@@ -104,6 +186,51 @@ class SCSSProgram(Program):
 
 class TemplatedProgram(Program):
     default_template = None
+    parallel_prepare = True
+
+    #: context attributes set by `parse()`, which are stored in the build
+    #: manifest along with the page configuration
+    state_attributes = ("html", "summary")
+
+    def prepare(self):
+        builder = self.context.builder
+        manifest = builder.manifest
+        source_filename = self.context.source_filename
+        filenames = (
+            self.context.full_source_filename,
+            self.context.full_source_metadata_filename,
+        )
+        digest = None
+        if all(builder.is_unchanged(x) for x in filenames):
+            digest = manifest.get_digest(source_filename)
+        if digest is None:
+            digest = get_file_digest(*filenames)
+        state = manifest.get(source_filename, digest)
+        if state is None:
+            cfg = self.parse()
+            manifest.put(
+                source_filename,
+                digest,
+                self.get_state(cfg),
+                self.context.dependencies.union(self.context.config.filenames),
+            )
+        else:
+            self.restore_state(state)
+
+    def parse(self):
+        """Parses the source page, returns its configuration"""
+        raise NotImplementedError()
+
+    def get_state(self, cfg):
+        state = {"cfg": cfg}
+        for name in self.state_attributes:
+            state[name] = getattr(self.context, name)
+        return state
+
+    def restore_state(self, state):
+        self._process_header(state["cfg"])
+        for name in self.state_attributes:
+            setattr(self.context, name, state[name])
 
     def get_template_context(self):
         return {
@@ -120,8 +247,8 @@ class TemplatedProgram(Program):
         context = self.get_template_context()
         rv = self.context.render_template(template_name, context)
 
-        os.makedirs(self.context.destination_folder, exist_ok=True)
-        with open(self.context.full_destination_filename, "w") as f:
+        output = self.context.builder.output
+        with output.open(self.context.full_destination_filename) as f:
             f.write(rv + "\n")
 
     def render_contents(self):
@@ -141,7 +268,7 @@ class TemplatedProgram(Program):
     def _load_metadata_file(self):
         """Load a sidecar yaml based metadata file, if there is one, returns a dict"""
         path = self.context.full_source_metadata_filename
-        if not os.path.exists(path):
+        if not self.context.builder.stat_cache.exists(path):
             return {}
         with open(path) as f:
             cfg = yaml.load(f, yaml.SafeLoader)
@@ -208,16 +335,22 @@ class HTMLProgram(TemplatedProgram):
 
     default_template = "rst_display.html"
 
-    def prepare(self):
+    def parse(self):
         cfg, self.context.html = self.load_source()
+        return cfg
 
 
 class MarkdownProgram(TemplatedProgram):
     """A program that renders a markdown file into a template"""
 
     default_template = "rst_display.html"
+    state_attributes = TemplatedProgram.state_attributes + (
+        "description",
+        "image",
+        "image_alt",
+    )
 
-    def prepare(self):
+    def parse(self):
         def url_for_path(path):
             if path is None:
                 return None
@@ -226,29 +359,43 @@ class MarkdownProgram(TemplatedProgram):
 
         cfg, md = self.load_source()
         md = self.process_embedded_rst_directives(md)
-        html = markdown.markdown(
-            md,
-            extensions=MARKDOWN_EXTENSIONS.keys(),
-            extension_configs=MARKDOWN_EXTENSIONS,
-        )
+        html = self.render_markdown(md)
 
-        html = fix_relative_urls("/", self.context.slug, html)
-        self.context.html = html
+        with self.context.builder.stats.measure("lxml"):
+            processed = process_html("/", self.context.slug, html)
+        self.context.html = processed.html
 
-        if self.context.summary is None:
-            summary = get_html_summary(self.context.html)
-            if summary:
-                self.context.summary = Markup(summary)
-        og_properties = get_og_properties(html)
+        if self.context.summary is None and processed.summary:
+            self.context.summary = Markup(processed.summary)
+        og_properties = processed.og_properties
         self.context.description = cfg.get("description", og_properties.description)
         self.context.image = url_for_path(cfg.get("image"))
         self.context.image_alt = cfg.get("image_alt")
         if self.context.image is None and og_properties.image is not None:
             self.context.image = url_for_path(og_properties.image)
             self.context.image_alt = og_properties.image_alt
+        return cfg
+
+    def render_markdown(self, md):
+        key = make_key(
+            "md",
+            md,
+            repr(MARKDOWN_EXTENSIONS),
+            self.context.config.get("rst_header_level", 2),
+        )
+        html = self.context.get_cached_render(key)
+        if html is None:
+            stats = self.context.builder.stats
+            converter = get_markdown_converter(stats)
+            with stats.measure("markdown"):
+                html = converter.reset().convert(md)
+            self.context.set_cached_render(key, html)
+        return html
 
     def process_embedded_rst_directives(self, src):
         lst = []
+        rst_sources = []
+        rst_indices = []
         fl = StringIO(src)
         while True:
             line = fl.readline()
@@ -261,8 +408,11 @@ class MarkdownProgram(TemplatedProgram):
                     if line.startswith(4 * " ") or line == "\n":
                         rst_lst.append(line)
                     else:
-                        rst = "".join(rst_lst)
-                        lst.append(self.process_rst_directive(rst))
+                        # Keep a slot for the fragment, all directives are
+                        # rendered at once below
+                        rst_sources.append("".join(rst_lst))
+                        rst_indices.append(len(lst))
+                        lst.append(None)
                         lst.append("\n")
 
                         # The line we just read is not rst, don't forget to add
@@ -271,8 +421,8 @@ class MarkdownProgram(TemplatedProgram):
                         break
             else:
                 lst.append(line)
+        if rst_sources:
+            fragments = self.context.render_rst_fragments(rst_sources)
+            for idx, fragment in zip(rst_indices, fragments):
+                lst[idx] = fragment
         return "".join(lst)
-
-    def process_rst_directive(self, rst):
-        rv = self.context.render_rst(rst)
-        return rv["fragment"]
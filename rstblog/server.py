@@ -8,21 +8,104 @@ Development server that rebuilds automatically
 :license: BSD, see LICENSE for more details.
 """
 
+import logging
 import os
 import posixpath
-import sys
+import threading
+import time
 import urllib.error
 import urllib.parse
 import urllib.request
-from http.server import HTTPServer, SimpleHTTPRequestHandler
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from rstblog.watcher import create_watcher
+
+logger = logging
+
+#: path of the server-sent events stream telling pages to reload
+EVENTS_PATH = "/__rstblog__/events"
+
+#: seconds to wait after a change, so that a burst of changes (an editor
+#: saving a file, a checkout) triggers a single build
+CHANGE_DEBOUNCE = 0.2
+
+#: seconds between keep-alive comments on the events stream
+EVENTS_KEEPALIVE = 15
+
+LIVE_RELOAD_SCRIPT = (
+    "<script>"
+    'new EventSource("%s").onmessage = function() { location.reload(); };'
+    "</script>" % EVENTS_PATH
+)
 
 
 class SimpleRequestHandler(SimpleHTTPRequestHandler):
     def do_GET(self):
-        if self.server.builder.anything_needs_build():
-            print("Detected change, building", file=sys.stderr)
-            self.server.builder.run()
-        SimpleHTTPRequestHandler.do_GET(self)
+        if self.path == EVENTS_PATH:
+            self.send_events()
+            return
+        path = self.get_html_path()
+        if path is not None:
+            self.send_html(path)
+        else:
+            SimpleHTTPRequestHandler.do_GET(self)
+
+    def do_HEAD(self):
+        path = self.get_html_path()
+        if path is not None:
+            self.send_html(path, head=True)
+        else:
+            SimpleHTTPRequestHandler.do_HEAD(self)
+
+    def get_html_path(self):
+        """Returns the path of the HTML page requested, or None if the request
+        is not for an HTML page"""
+        path = self.translate_path(self.path)
+        if os.path.isdir(path) and self.path.split("?", 1)[0].endswith("/"):
+            path = os.path.join(path, "index.html")
+        if path.endswith(".html") and os.path.isfile(path):
+            return path
+        return None
+
+    def send_html(self, path, head=False):
+        """Sends an HTML page, with the live reload script injected. If `head`
+        is True, only sends the headers."""
+        with open(path, "rb") as f:
+            content = f.read()
+        script = LIVE_RELOAD_SCRIPT.encode("utf-8")
+        idx = content.rfind(b"</body>")
+        if idx == -1:
+            content += script
+        else:
+            content = content[:idx] + script + content[idx:]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(content)))
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        if not head:
+            self.wfile.write(content)
+
+    def send_events(self):
+        """Streams a "reload" event each time a build finishes"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        generation = self.server.build_generation
+        try:
+            while True:
+                new_generation = self.server.wait_for_build(
+                    generation, EVENTS_KEEPALIVE
+                )
+                if new_generation == generation:
+                    self.wfile.write(b": keep-alive\n\n")
+                else:
+                    generation = new_generation
+                    self.wfile.write(b"data: reload\n\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
 
     def translate_path(self, path):
         path = path.split("?", 1)[0].split("#", 1)[0]
@@ -48,7 +131,58 @@ class SimpleRequestHandler(SimpleHTTPRequestHandler):
         pass
 
 
-class Server(HTTPServer):
+class Server(ThreadingHTTPServer):
+    """Serves the output folder while a background thread rebuilds the
+    project when files change. Requests are served the last built output
+    and never wait for a build."""
+
+    daemon_threads = True
+
     def __init__(self, host, port, builder):
-        HTTPServer.__init__(self, (host, int(port)), SimpleRequestHandler)
+        ThreadingHTTPServer.__init__(self, (host, int(port)), SimpleRequestHandler)
         self.builder = builder
+        self.build_generation = 0
+        self._build_finished = threading.Condition()
+        self.watcher = create_watcher(
+            builder.project_folder,
+            [builder.default_output_folder, builder.cache_folder],
+        )
+        self.watcher.start()
+        if builder.anything_needs_build():
+            builder.run()
+        self._build_thread = threading.Thread(target=self.build_loop, daemon=True)
+        self._build_thread.start()
+
+    def build_loop(self):
+        # Changes are kept until a build succeeds
+        changes = set()
+        while True:
+            self.watcher.changed.wait()
+            time.sleep(CHANGE_DEBOUNCE)
+            # Filtered here rather than in the watcher thread, since it reads
+            # the manifest
+            new_changes = self.builder.get_relevant_changes(self.watcher.pop_changes())
+            if not new_changes:
+                continue
+            logger.info("Detected change, building")
+            for path in sorted(new_changes):
+                logger.info("   %s", os.path.relpath(path, self.builder.project_folder))
+            changes |= new_changes
+            try:
+                self.builder.run(changes=changes)
+            except Exception:
+                logger.exception("Build failed, serving the previous output")
+                continue
+            changes = set()
+            with self._build_finished:
+                self.build_generation += 1
+                self._build_finished.notify_all()
+
+    def wait_for_build(self, generation, timeout):
+        """Waits until a build more recent than `generation` finished, or
+        until `timeout` expired. Returns the current build generation."""
+        with self._build_finished:
+            self._build_finished.wait_for(
+                lambda: self.build_generation != generation, timeout
+            )
+            return self.build_generation
@@ -33,3 +33,20 @@ before_build_finished = signals.signal("before_build_finished")
 
 #: emitted right before a file is actually built.
 before_file_built = signals.signal("before_file_built")
+
+
+def send(signal, sender, stats=None, **kwargs):
+    """Sends `signal` like `signal.send()`. When `stats` is profiling, the
+    time spent in each receiver is measured."""
+    if stats is None or not stats.profiling:
+        return signal.send(sender, **kwargs)
+    rv = []
+    for receiver in signal.receivers_for(sender):
+        name = "signal %s: %s.%s" % (
+            signal.name,
+            getattr(receiver, "__module__", "?"),
+            getattr(receiver, "__qualname__", repr(receiver)),
+        )
+        with stats.measure(name):
+            rv.append((receiver, receiver(sender, **kwargs)))
+    return rv
@@ -0,0 +1,74 @@
+"""
+rstblog.statcache
+~~~~~~~~~~~~~~~~~
+
+Caches file status during a build, so that checking whether files need to be
+rebuilt does not stat the same files over and over.
+
+:copyright: (c) 2026 by Aurélien Gâteau.
+:license: BSD, see LICENSE for more details.
+"""
+
+import os
+
+
+class StatCache:
+    """Caches `os.stat()` results until `clear()` is called.
+
+    Entries returned by `os.scandir()` can be added: their status is then
+    only fetched when needed. Once all the entries of a folder have been
+    added, files missing from it are known not to exist without asking the
+    file system.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        #: maps paths to a DirEntry, an os.stat_result or None for missing
+        #: files
+        self._entries = {}
+        self._scanned_folders = set()
+
+    def add_scandir_entries(self, folder, entries):
+        """Adds the entries returned by `os.scandir(folder)`"""
+        for entry in entries:
+            self._entries[entry.path] = entry
+        self._scanned_folders.add(folder)
+
+    def stat(self, path):
+        """Returns the os.stat_result of `path`, or None if it does not
+        exist"""
+        try:
+            entry = self._entries[path]
+        except KeyError:
+            if os.path.dirname(path) in self._scanned_folders:
+                return None
+            try:
+                entry = os.stat(path)
+            except (FileNotFoundError, NotADirectoryError):
+                entry = None
+            self._entries[path] = entry
+            return entry
+        if isinstance(entry, os.DirEntry):
+            try:
+                entry = entry.stat()
+            except FileNotFoundError:
+                # Removed since the folder was scanned
+                entry = None
+            self._entries[path] = entry
+        return entry
+
+    def exists(self, path):
+        return self.stat(path) is not None
+
+    def get_mtime(self, path):
+        """Returns the modification time of `path`, or None if it does not
+        exist"""
+        stat = self.stat(path)
+        return None if stat is None else stat.st_mtime
+
+    def invalidate(self, path):
+        """Forgets what is known about `path`, which has been modified"""
+        self._entries.pop(path, None)
+        self._scanned_folders.discard(os.path.dirname(path))
@@ -0,0 +1,160 @@
+"""
+rstblog.stats
+~~~~~~~~~~~~~
+
+Build statistics and profiling.
+
+:copyright: (c) 2026 by Aurélien Gâteau.
+:license: BSD, see LICENSE for more details.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+#: default number of files listed by `BuildStats.format_profile()`
+DEFAULT_PROFILE_TOP = 20
+
+
+class BuildStats:
+    """Accumulates how many times each step of a build ran and how long it
+    took, and counters like the number of bytes written.
+
+    When `profiling` is True, each measured step is also recorded as an
+    event, to produce a Chrome trace of the build.
+    """
+
+    def __init__(self, profiling=False):
+        self.profiling = profiling
+        self.reset()
+
+    def reset(self):
+        #: maps step names to [count, seconds, CPU seconds]
+        self.timings = {}
+        #: maps counter names to [count, total]
+        self.counters = {}
+        #: maps source filenames to [seconds, CPU seconds]
+        self.file_timings = {}
+        #: trace events, in the Chrome trace event format
+        self.events = []
+
+    @contextmanager
+    def measure(self, name, filename=None):
+        """Measures the wall and CPU time of the block. If `filename` is set,
+        the time is also accounted to that source file."""
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            cpu_seconds = time.process_time() - cpu_start
+            self.add(name, seconds, cpu_seconds=cpu_seconds)
+            if filename is not None:
+                timing = self.file_timings.setdefault(filename, [0.0, 0.0])
+                timing[0] += seconds
+                timing[1] += cpu_seconds
+            if self.profiling:
+                event = {
+                    "name": name,
+                    "ph": "X",
+                    "ts": start * 1e6,
+                    "dur": seconds * 1e6,
+                    "pid": os.getpid(),
+                    "tid": threading.get_native_id(),
+                }
+                if filename is not None:
+                    event["args"] = {"file": filename}
+                self.events.append(event)
+
+    def add(self, name, seconds, count=1, cpu_seconds=0.0):
+        timing = self.timings.setdefault(name, [0, 0.0, 0.0])
+        timing[0] += count
+        timing[1] += seconds
+        timing[2] += cpu_seconds
+
+    def count(self, name, amount, count=1):
+        counter = self.counters.setdefault(name, [0, 0])
+        counter[0] += count
+        counter[1] += amount
+
+    def take(self):
+        """Returns what has been recorded and resets it, to hand it over to
+        another process"""
+        rv = (self.timings, self.counters, self.file_timings, self.events)
+        self.reset()
+        return rv
+
+    def merge(self, stats):
+        timings, counters, file_timings, events = stats
+        for name, (count, seconds, cpu_seconds) in timings.items():
+            self.add(name, seconds, count, cpu_seconds)
+        for name, (count, amount) in counters.items():
+            self.count(name, amount, count)
+        for filename, (seconds, cpu_seconds) in file_timings.items():
+            timing = self.file_timings.setdefault(filename, [0.0, 0.0])
+            timing[0] += seconds
+            timing[1] += cpu_seconds
+        self.events.extend(events)
+
+    def format(self):
+        """Returns the timings as lines of text, slowest step first, followed
+        by the counters"""
+        items = sorted(self.timings.items(), key=lambda x: x[1][1], reverse=True)
+        width = max((len(x) for x in [*self.timings, *self.counters]), default=0)
+        lines = [
+            "%-*s %8.3fs  (%d)" % (width, name, seconds, count)
+            for name, (count, seconds, _) in items
+        ]
+        lines.extend(
+            "%-*s %9d  (%d)" % (width, name, amount, count)
+            for name, (count, amount) in sorted(self.counters.items())
+        )
+        return lines
+
+    def format_profile(self, top=DEFAULT_PROFILE_TOP):
+        """Returns the wall and CPU time of each step, slowest first, followed
+        by the `top` slowest files, as lines of text"""
+        items = sorted(self.timings.items(), key=lambda x: x[1][1], reverse=True)
+        width = max((len(x) for x in self.timings), default=0)
+        lines = ["%-*s %9s %9s %7s" % (width, "step", "wall", "cpu", "count")]
+        lines.extend(
+            "%-*s %8.3fs %8.3fs %7d" % (width, name, seconds, cpu_seconds, count)
+            for name, (count, seconds, cpu_seconds) in items
+        )
+
+        files = sorted(self.file_timings.items(), key=lambda x: x[1][0], reverse=True)
+        files = files[:top]
+        width = max((len(x) for x, _ in files), default=0)
+        lines.append("")
+        lines.append("%-*s %9s %9s" % (width, "slowest files", "wall", "cpu"))
+        lines.extend(
+            "%-*s %8.3fs %8.3fs" % (width, filename, seconds, cpu_seconds)
+            for filename, (seconds, cpu_seconds) in files
+        )
+        return lines
+
+    def get_trace(self):
+        """Returns the recorded events and timings as a dict in the Chrome
+        trace format, which can be dumped as JSON"""
+        origin = min((x["ts"] for x in self.events), default=0)
+        events = [dict(x, ts=x["ts"] - origin) for x in self.events]
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {
+                "timings": {
+                    name: {"count": count, "wall": seconds, "cpu": cpu_seconds}
+                    for name, (count, seconds, cpu_seconds) in self.timings.items()
+                },
+                "files": {
+                    filename: {"wall": seconds, "cpu": cpu_seconds}
+                    for filename, (seconds, cpu_seconds) in self.file_timings.items()
+                },
+                "counters": {
+                    name: {"count": count, "total": amount}
+                    for name, (count, amount) in self.counters.items()
+                },
+            },
+        }
@@ -0,0 +1,594 @@
+"""
+rstblog.thumbnails
+~~~~~~~~~~~~~~~~~~
+
+Thumbnail generation. Thumbnails are generated by a pool of processes, and
+their sizes are remembered in an index so that up to date thumbnails do not
+have to be opened. The worker processes of a parallel build ask the build
+process for their thumbnails, so that each is only generated once.
+
+:copyright: (c) 2026 by Aurélien Gâteau.
+:license: BSD, see LICENSE for more details.
+"""
+
+import functools
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+from collections import namedtuple
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing.connection import Client, Listener
+
+import PIL.Image
+
+from rstblog import picklefile
+from rstblog.output import FILE_MODE
+
+logger = logging
+
+#: bump this when the format of the index changes
+INDEX_VERSION = 5
+
+THUMBNAIL_INDEX_FILENAME = "thumbnails"
+
+RESAMPLE_FILTERS = {
+    "nearest": PIL.Image.Resampling.NEAREST,
+    "box": PIL.Image.Resampling.BOX,
+    "bilinear": PIL.Image.Resampling.BILINEAR,
+    "hamming": PIL.Image.Resampling.HAMMING,
+    "bicubic": PIL.Image.Resampling.BICUBIC,
+    "lanczos": PIL.Image.Resampling.LANCZOS,
+}
+
+#: images are first reduced by an integer factor to about this many times the
+#: thumbnail size, then resampled. See `PIL.Image.Image.resize()`.
+REDUCING_GAP = 3.0
+
+EXIF_ORIENTATION = 0x0112
+
+EXIF_TRANSPOSE_METHODS = {
+    2: PIL.Image.Transpose.FLIP_LEFT_RIGHT,
+    3: PIL.Image.Transpose.ROTATE_180,
+    4: PIL.Image.Transpose.FLIP_TOP_BOTTOM,
+    5: PIL.Image.Transpose.TRANSPOSE,
+    6: PIL.Image.Transpose.ROTATE_270,
+    7: PIL.Image.Transpose.TRANSVERSE,
+    8: PIL.Image.Transpose.ROTATE_90,
+}
+
+#: formats thumbnails can be generated in besides the format of the image,
+#: mapped to their MIME type
+EXTRA_FORMATS = {
+    "webp": "image/webp",
+    "avif": "image/avif",
+}
+
+#: a file generated for a thumbnail. `format` is None for the format of the
+#: image.
+Variant = namedtuple("Variant", ("relpath", "density", "format"))
+
+
+class Thumbnail(namedtuple("Thumbnail", ("relpath", "width", "height", "variants"))):
+    """A generated thumbnail. `relpath`, `width` and `height` describe the 1x
+    thumbnail in the format of the image, `variants` lists all the generated
+    files, including this one."""
+
+    __slots__ = ()
+
+    def __new__(cls, relpath, width, height, variants=()):
+        return super().__new__(cls, relpath, width, height, variants)
+
+    def get_srcset(self, format=None):
+        """Returns the srcset attribute listing the variants in `format`, or
+        an empty string if there is only the 1x one"""
+        variants = [x for x in self.variants if x.format == format]
+        if format is None and len(variants) < 2:
+            return ""
+        return ", ".join("%s %dx" % (x.relpath, x.density) for x in variants)
+
+    @property
+    def srcset(self):
+        return self.get_srcset()
+
+    @property
+    def sources(self):
+        """(MIME type, srcset) of the variants in extra formats, to be used as
+        <source> elements of a <picture>"""
+        formats = sorted({x.format for x in self.variants if x.format is not None})
+        return [(EXTRA_FORMATS[x], self.get_srcset(x)) for x in formats]
+
+
+def get_supported_formats(formats):
+    """Returns the formats from `formats` which Pillow can write"""
+    # Only the most common plugins are registered until Pillow needs another
+    # one: register them all
+    PIL.Image.init()
+    extensions = PIL.Image.registered_extensions()
+    supported = []
+    for format in formats:
+        if format not in EXTRA_FORMATS:
+            raise ValueError(
+                "unknown thumbnail format %r, expected one of: %s"
+                % (format, ", ".join(EXTRA_FORMATS))
+            )
+        plugin = extensions.get("." + format)
+        if plugin is None or plugin not in PIL.Image.SAVE:
+            logger.warning("Pillow cannot write %s files, skipping them", format)
+            continue
+        supported.append(format)
+    return supported
+
+
+def get_thumbnail_relpath(image_relpath, size, square=False):
+    """Returns the path of the 1x thumbnail of `image_relpath`. It contains
+    the size and the square flag, so that directives asking for different
+    thumbnails of the same image do not overwrite each other's."""
+    dirname, basename = os.path.split(image_relpath)
+    prefix = "thumb_%d%s_" % (size, "sq" if square else "")
+    return os.path.join(dirname, prefix + basename)
+
+
+def get_legacy_thumbnail_relpath(image_relpath):
+    """Returns the path thumbnails of `image_relpath` had before their size
+    became part of it"""
+    dirname, basename = os.path.split(image_relpath)
+    return os.path.join(dirname, "thumb_" + basename)
+
+
+def get_variant_relpath(thumbnail_relpath, density, format):
+    root, ext = os.path.splitext(thumbnail_relpath)
+    if density != 1:
+        root += "@%dx" % density
+    if format is not None:
+        ext += "." + format
+    return root + ext
+
+
+def need_update(dst, src):
+    """
+    Returns true if file dst does not exist, or is older than src
+    """
+    if not os.path.exists(dst):
+        return True
+    return os.path.getmtime(src) > os.path.getmtime(dst)
+
+
+def get_resample_filter(name):
+    try:
+        return RESAMPLE_FILTERS[name]
+    except KeyError:
+        raise ValueError(
+            "unknown thumbnail resampling filter %r, expected one of: %s"
+            % (name, ", ".join(RESAMPLE_FILTERS))
+        )
+
+
+def resize_image(image_abspath, variants, size, square=False, resample="bilinear"):
+    """Writes the thumbnails `variants` of the image at `image_abspath`.
+    `variants` is a list of (path, density, format) tuples. Returns the
+    (width, height) of the 1x thumbnail.
+
+    Runs in the thumbnail worker processes, so it tries hard to bound memory
+    usage: the image is decoded once for all variants, JPEG images are
+    decoded at the smallest scale larger than the largest variant, and
+    variants are oriented according to the EXIF data instead of the full
+    image.
+    """
+    resample_filter = get_resample_filter(resample)
+    densities = sorted({x[1] for x in variants}, reverse=True)
+    resized = {}
+    with PIL.Image.open(image_abspath) as big_img:
+        orientation = big_img.getexif().get(EXIF_ORIENTATION)
+
+        # The ratio does not depend on the orientation, so work on the image
+        # as stored
+        if square:
+            ratio = min(big_img.size) / float(size)
+        else:
+            ratio = max(big_img.size) / float(size)
+
+        image_size = big_img.size
+        big_img.draft(big_img.mode, [int(x * densities[0] / ratio) for x in image_size])
+        for density in densities:
+            thumb_size = [int(x * density / ratio) for x in image_size]
+            resized[density] = big_img.resize(
+                thumb_size, resample_filter, reducing_gap=REDUCING_GAP
+            )
+
+    method = EXIF_TRANSPOSE_METHODS.get(orientation)
+    for density, thumb_img in resized.items():
+        if square:
+            padding = [(x - size * density) / 2 for x in thumb_img.size]
+            thumb_img = thumb_img.crop(
+                (
+                    padding[0],
+                    padding[1],
+                    thumb_img.width - padding[0],
+                    thumb_img.height - padding[1],
+                )
+            )
+        if method is not None:
+            thumb_img = thumb_img.transpose(method)
+        resized[density] = thumb_img
+
+    PIL.Image.init()
+    extensions = PIL.Image.registered_extensions()
+    for path, density, format in variants:
+        # Write to a temporary file, so that a half-written thumbnail is never
+        # visible. Its name is unique, since other processes may be writing
+        # the same thumbnail.
+        ext = os.path.splitext(path)[1].lower()
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(path), prefix="." + os.path.basename(path)
+        )
+        try:
+            with os.fdopen(fd, "wb") as f:
+                resized[density].save(f, format=extensions[ext])
+            os.chmod(tmp_path, FILE_MODE)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    return resized[1].size
+
+
+def _get_done_future(result):
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+class _RemoteFuture(Future):
+    """Future of a thumbnail requested to a ThumbnailService. Waiting for it
+    receives the responses of the service."""
+
+    def __init__(self, client):
+        super().__init__()
+        self._client = client
+
+    def result(self, timeout=None):
+        while not self.done():
+            self._client.receive()
+        return super().result(timeout)
+
+
+class _ThumbnailClient:
+    """Sends the thumbnail requests of a worker process to a
+    ThumbnailService. Requests are answered as soon as their thumbnail is
+    ready, so several of them can be pending."""
+
+    def __init__(self, address, authkey):
+        self.connection = Client(address, authkey=authkey)
+        self.futures = {}
+        self.next_id = 0
+
+    def submit(self, *args):
+        request_id = self.next_id
+        self.next_id += 1
+        future = _RemoteFuture(self)
+        self.futures[request_id] = future
+        self.connection.send((request_id, args))
+        return future
+
+    def receive(self):
+        request_id, thumbnail, exc = self.connection.recv()
+        future = self.futures.pop(request_id)
+        if exc is None:
+            future.set_result(thumbnail)
+        else:
+            future.set_exception(exc)
+
+
+class ThumbnailService:
+    """Generates the thumbnails requested by the worker processes forked
+    while it runs, using `generator`. Each connection is served by a
+    thread."""
+
+    def __init__(self, generator):
+        self.generator = generator
+        self.authkey = os.urandom(32)
+        self.listener = Listener(authkey=self.authkey)
+        self.address = self.listener.address
+        self.connections = []
+        self.closed = False
+        self._accept_thread = threading.Thread(target=self._accept, daemon=True)
+        self._accept_thread.start()
+
+    def close(self):
+        self.closed = True
+        # Wake up the thread waiting for connections
+        Client(self.address, authkey=self.authkey).close()
+        self._accept_thread.join()
+        self.listener.close()
+        for connection in self.connections:
+            connection.close()
+
+    def _accept(self):
+        while True:
+            try:
+                connection = self.listener.accept()
+            except (OSError, multiprocessing.AuthenticationError):
+                continue
+            if self.closed:
+                connection.close()
+                return
+            self.connections.append(connection)
+            threading.Thread(
+                target=self._serve, args=(connection,), daemon=True
+            ).start()
+
+    def _serve(self, connection):
+        send_lock = threading.Lock()
+
+        def reply(request_id, future):
+            try:
+                response = (request_id, future.result(), None)
+            except Exception as exc:
+                response = (request_id, None, exc)
+            with send_lock:
+                try:
+                    connection.send(response)
+                except OSError:
+                    # The worker is gone
+                    pass
+
+        while True:
+            try:
+                request_id, args = connection.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                future = self.generator.submit(*args)
+            except Exception as exc:
+                future = Future()
+                future.set_exception(exc)
+            future.add_done_callback(functools.partial(reply, request_id))
+
+
+class ThumbnailGenerator:
+    """Generates thumbnails, keeping an index of their sizes.
+
+    The index maps the path of each thumbnail to the path, modification time
+    and size of the image and the parameters it has been generated with, and
+    to the size of the thumbnail.
+    """
+
+    def __init__(
+        self,
+        index_filename,
+        max_workers=None,
+        resample="bilinear",
+        densities=(1,),
+        formats=(),
+    ):
+        self.index_filename = index_filename
+        self.max_workers = max_workers
+        self.resample = resample
+        # Fail early on typos
+        get_resample_filter(resample)
+        #: pixel densities thumbnails are generated for, 1 always comes first
+        self.densities = (1,) + tuple(sorted(set(densities) - {1}))
+        #: formats thumbnails are generated in, besides the format of the image
+        self.formats = tuple(get_supported_formats(formats))
+        self.index = {}
+        self.new_entries = {}
+        self.dirty = False
+        #: paths of the thumbnails requested by this build
+        self.requested = set()
+        #: paths of thumbnails of the images generated by this build, as named
+        #: by previous versions
+        self.legacy = set()
+        #: maps the paths of the thumbnails being generated to the parameters
+        #: they are generated with and the Future of their Thumbnail
+        self._pending = {}
+        self._executor = None
+        #: (address, authkey) of the ThumbnailService worker processes send
+        #: their requests to
+        self.service_address = None
+        self._client = None
+        # Thumbnails are requested by the threads of the ThumbnailService,
+        # and remembered by the threads of the executor
+        self._lock = threading.RLock()
+
+    def load(self):
+        self.new_entries = {}
+        self.dirty = False
+        self.requested = set()
+        self.legacy = set()
+        self.index = (
+            picklefile.load(self.index_filename, INDEX_VERSION, "thumbnail index") or {}
+        )
+
+    def save(self):
+        if not self.dirty:
+            return
+        picklefile.save(self.index_filename, INDEX_VERSION, self.index)
+        self.dirty = False
+
+    def shutdown(self):
+        """Stops the worker processes, if any. They are started again when
+        needed."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def remove_legacy_thumbnails(self):
+        """Removes the thumbnails previous versions generated for the images
+        thumbnails have been generated for"""
+        for path in sorted(self.legacy - self.requested):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                continue
+            print(f"  Removed legacy thumbnail {path}")
+        self.legacy = set()
+        self.requested = set()
+
+    def start_service(self):
+        """Starts a ThumbnailService, which the worker processes forked until
+        it is closed send their requests to, returns it"""
+        service = ThumbnailService(self)
+        self.service_address = (service.address, service.authkey)
+        return service
+
+    def stop_service(self, service):
+        self.service_address = None
+        service.close()
+
+    def take_new_entries(self):
+        """Returns the index entries added since the last call, to hand them
+        over to another process"""
+        with self._lock:
+            entries = self.new_entries
+            self.new_entries = {}
+        return entries
+
+    def add_entries(self, entries):
+        if entries:
+            with self._lock:
+                self.index.update(entries)
+                self.dirty = True
+
+    def _add_entry(self, key, entry):
+        with self._lock:
+            self.index[key] = entry
+            self.new_entries[key] = entry
+            self.dirty = True
+
+    def _get_executor(self):
+        # Daemon processes, like the workers of a parallel build, cannot
+        # start processes: generate thumbnails inline there
+        if multiprocessing.current_process().daemon:
+            return None
+        if self._executor is None:
+            # Builds can run in a thread of the development server, while
+            # other threads hold locks: do not fork workers, which would
+            # inherit these locks held
+            if "forkserver" in multiprocessing.get_all_start_methods():
+                mp_context = multiprocessing.get_context("forkserver")
+            else:
+                mp_context = multiprocessing.get_context("spawn")
+            self._executor = ProcessPoolExecutor(
+                self.max_workers, mp_context=mp_context
+            )
+        return self._executor
+
+    def generate(self, base_path, image_relpath, size, square=False):
+        """Generates or updates a thumbnail for an image at
+        $base_path/$image_relpath, returns a Thumbnail"""
+        return self.submit(base_path, image_relpath, size, square).result()
+
+    def submit(self, base_path, image_relpath, size, square=False):
+        """Like `generate()`, but returns a Future of the Thumbnail, so that
+        several thumbnails can be generated in parallel.
+
+        If `square` is True, crop the image in its center to produce a square
+        thumbnail.
+        """
+        if (
+            self.service_address is not None
+            and multiprocessing.current_process().daemon
+        ):
+            if self._client is None:
+                self._client = _ThumbnailClient(*self.service_address)
+            return self._client.submit(base_path, image_relpath, size, square)
+        with self._lock:
+            return self._submit(base_path, image_relpath, size, square)
+
+    def _submit(self, base_path, image_relpath, size, square):
+        thumbnail_relpath = get_thumbnail_relpath(image_relpath, size, square)
+        variants = tuple(
+            Variant(get_variant_relpath(thumbnail_relpath, x, y), x, y)
+            for y in (None,) + self.formats
+            for x in self.densities
+        )
+        variant_abspaths = [os.path.join(base_path, x.relpath) for x in variants]
+        image_abspath = os.path.join(base_path, image_relpath)
+
+        def is_up_to_date():
+            return not any(need_update(x, image_abspath) for x in variant_abspaths)
+
+        stat = os.stat(image_abspath)
+        # Existing thumbnails are only trusted if the index tells they have
+        # been generated from the same image with the same parameters
+        key = os.path.abspath(variant_abspaths[0])
+        params = (
+            os.path.abspath(image_abspath),
+            size,
+            square,
+            self.densities,
+            self.formats,
+            self.resample,
+            stat.st_mtime_ns,
+            stat.st_size,
+        )
+        self.requested.update(os.path.abspath(x) for x in variant_abspaths)
+        entry = self.index.get(key)
+        if entry is not None and entry[0] == params and is_up_to_date():
+            return _get_done_future(Thumbnail(thumbnail_relpath, *entry[1:], variants))
+
+        def remember(thumb_size):
+            self._add_entry(key, (params,) + tuple(thumb_size))
+            return Thumbnail(thumbnail_relpath, *thumb_size, variants)
+
+        # Some of its files may already be written, do not trust them yet
+        pending = self._pending.get(variant_abspaths[0])
+        if pending is not None and pending[0] == params:
+            return pending[1]
+
+        if entry is None and is_up_to_date():
+            # The index has been lost: trust the thumbnail if it has the
+            # expected size, rather than generating it again
+            with PIL.Image.open(variant_abspaths[0]) as image:
+                thumb_size = image.size
+            if square:
+                expected = thumb_size == (size, size)
+            else:
+                expected = max(thumb_size) == size
+            if expected:
+                return _get_done_future(remember(thumb_size))
+
+        print(f"  Generating thumbnail for {image_relpath}")
+        legacy_relpath = get_legacy_thumbnail_relpath(image_relpath)
+        self.legacy.update(
+            os.path.abspath(
+                os.path.join(
+                    base_path, get_variant_relpath(legacy_relpath, x.density, x.format)
+                )
+            )
+            for x in variants
+        )
+        args = (
+            image_abspath,
+            [(x, y.density, y.format) for x, y in zip(variant_abspaths, variants)],
+            size,
+            square,
+            self.resample,
+        )
+        executor = self._get_executor()
+        if executor is None:
+            return _get_done_future(remember(resize_image(*args)))
+
+        future = Future()
+        self._pending[variant_abspaths[0]] = (params, future)
+
+        def on_done(resize_future):
+            # Resolve the future without holding the lock, its callbacks may
+            # send it to a worker process
+            with self._lock:
+                self._pending.pop(variant_abspaths[0], None)
+                try:
+                    thumbnail = remember(resize_future.result())
+                except BaseException as exc:
+                    error = exc
+                else:
+                    error = None
+            if error is None:
+                future.set_result(thumbnail)
+            else:
+                future.set_exception(error)
+
+        executor.submit(resize_image, *args).add_done_callback(on_done)
+        return future
@@ -8,6 +8,7 @@ Various utilities.
 :license: BSD, see LICENSE for more details.
 """
 
+import fnmatch
 import os
 import re
 from collections import namedtuple
@@ -15,10 +16,8 @@ from urllib.parse import urljoin, urlsplit
 
 import lxml.etree
 import lxml.html
-import PIL.Image
-from bs4 import BeautifulSoup
-from feedgen.feed import FeedGenerator
-from markupsafe import Markup
+
+from rstblog.cache import make_key
 
 
 def fix_relative_url(base_url, slug, input_url):
@@ -34,9 +33,69 @@ def fix_relative_url(base_url, slug, input_url):
     return urljoin(base_url, path)
 
 
-def fix_relative_urls(base_url, slug, content):
-    def process_elements(parent, tag, attribute):
-        for element in parent.iter(tag):
+class IgnoreMatcher:
+    """Tells whether filenames are ignored by a list of fnmatch patterns.
+
+    The first matching pattern decides: a filename matching a pattern starting
+    with "!" is kept, a filename matching any other pattern is ignored.
+    Filenames matching no pattern are kept. All patterns are compiled into a
+    single regular expression.
+    """
+
+    def __init__(self, patterns):
+        parts = []
+        for idx, pattern in enumerate(patterns):
+            if pattern[0] == "!":
+                name = "keep%d" % idx
+                pattern = pattern[1:]
+            else:
+                name = "ignore%d" % idx
+            regex = fnmatch.translate(os.path.normcase(pattern))
+            parts.append("(?P<%s>%s)" % (name, regex))
+        self._regex = re.compile("|".join(parts)) if parts else None
+
+    def is_ignored(self, filename):
+        if self._regex is None:
+            return False
+        match = self._regex.match(os.path.normcase(filename))
+        # The outer group of the first matching pattern is the last one to
+        # be closed
+        return match is not None and match.lastgroup.startswith("ignore")
+
+    def filter(self, filenames):
+        return [x for x in filenames if not self.is_ignored(x)]
+
+
+#: (tag, attribute) pairs holding URLs which must be fixed
+URL_ATTRIBUTES = (
+    ("img", "src"),
+    ("a", "href"),
+    ("video", "src"),
+    ("video", "poster"),
+    ("audio", "src"),
+    ("source", "src"),
+)
+
+
+#: (tag, attribute) pairs holding srcset lists, whose URLs must be fixed
+SRCSET_ATTRIBUTES = (
+    ("img", "srcset"),
+    ("source", "srcset"),
+)
+
+
+def fix_relative_srcset(base_url, slug, srcset):
+    candidates = []
+    for candidate in srcset.split(","):
+        url, *descriptor = candidate.split()
+        url = fix_relative_url(base_url, slug, url)
+        candidates.append(" ".join([url] + descriptor))
+    return ", ".join(candidates)
+
+
+def _fix_relative_urls_in_tree(base_url, slug, root):
+    for tag, attribute in URL_ATTRIBUTES:
+        for element in root.iter(tag):
             value = element.get(attribute)
             if not value:
                 continue
@@ -44,16 +103,14 @@ def fix_relative_urls(base_url, slug, content):
                 continue
             url = fix_relative_url(base_url, slug, value)
             element.set(attribute, url)
+    for tag, attribute in SRCSET_ATTRIBUTES:
+        for element in root.iter(tag):
+            value = element.get(attribute)
+            if value:
+                element.set(attribute, fix_relative_srcset(base_url, slug, value))
 
-    root = lxml.html.fromstring(content)
-    if len(root) == 0:
-        return content
-    process_elements(root, "img", "src")
-    process_elements(root, "a", "href")
-    process_elements(root, "video", "src")
-    process_elements(root, "video", "poster")
-    process_elements(root, "audio", "src")
-    process_elements(root, "source", "src")
+
+def _serialize_tree(root):
     html = lxml.etree.tostring(root).decode("utf-8")
 
     # Remove enclosing <div>, if any. It might not be there if the content is
@@ -65,56 +122,25 @@ def fix_relative_urls(base_url, slug, content):
     return html
 
 
-def need_update(dst, src):
-    """
-    Returns true if file dst does not exist, or is older than src
-    """
-    if not os.path.exists(dst):
-        return True
-    return os.path.getmtime(src) > os.path.getmtime(dst)
-
+def fix_relative_urls(base_url, slug, content):
+    root = lxml.html.fromstring(content)
+    if len(root) == 0:
+        return content
+    _fix_relative_urls_in_tree(base_url, slug, root)
+    return _serialize_tree(root)
 
-Thumbnail = namedtuple("Thumbnail", ("relpath", "width", "height"))
 
+ProcessedHtml = namedtuple("ProcessedHtml", ("html", "summary", "og_properties"))
 
-def generate_thumbnail(base_path, image_relpath, size, square=False):
-    """
-    Generates or updates a thumbnail for an image at $base_path/$image_relpath.
-    If `square` is True, crop the image in its center to produce a square
-    thumbnail.
-    Returns a Thumbnail
-    """
-    dirname, basename = os.path.split(image_relpath)
-    thumbnail_relpath = os.path.join(dirname, "thumb_" + basename)
-
-    thumbnail_abspath = os.path.join(base_path, thumbnail_relpath)
-    image_abspath = os.path.join(base_path, image_relpath)
-
-    if need_update(thumbnail_abspath, image_abspath):
-        print(f"  Generating thumbnail for {image_relpath}")
-        big_img = PIL.Image.open(image_abspath)
-        if square:
-            ratio = min(big_img.size) / float(size)
-            thumb_size = [int(x / ratio) for x in big_img.size]
-            thumb_img = big_img.resize(thumb_size, PIL.Image.BILINEAR)
-            padding = [(x - size) / 2 for x in thumb_img.size]
-            thumb_img = thumb_img.crop(
-                (
-                    padding[0],
-                    padding[1],
-                    thumb_img.width - padding[0],
-                    thumb_img.height - padding[1],
-                )
-            )
-        else:
-            ratio = max(big_img.size) / float(size)
-            thumb_size = [int(x / ratio) for x in big_img.size]
-            thumb_img = big_img.resize(thumb_size, PIL.Image.BILINEAR)
-        thumb_img.save(thumbnail_abspath)
-    else:
-        thumb_img = PIL.Image.open(thumbnail_abspath)
 
-    return Thumbnail(thumbnail_relpath, *thumb_img.size)
+def process_html(base_url, slug, content):
+    """Parses `content` once to fix its relative URLs, then extracts its summary
+    and its Open Graph properties. Returns a ProcessedHtml"""
+    root = lxml.html.fromstring(content)
+    if len(root) > 0:
+        _fix_relative_urls_in_tree(base_url, slug, root)
+        content = _serialize_tree(root)
+    return ProcessedHtml(content, get_html_summary(content), get_og_properties(root))
 
 
 BREAK_COMMENT = "\n<!-- break -->\n"
@@ -133,57 +159,37 @@ def get_html_summary(content):
 OgProperties = namedtuple("OgProperties", ("description", "image", "image_alt"))
 
 
-def get_og_properties(html_content):
-    """Returns on OgProperties for this html content.
+def get_og_properties(root):
+    """Returns on OgProperties for this lxml tree.
 
     Uses the first <p> as description and the url of the first <img> as image.
     """
-    if html_content is None:
-        return None, None
-    soup = BeautifulSoup(html_content, features="lxml")
-    para = soup.find("p")
-    if para:
-        description = Markup(para).striptags()
-    else:
-        description = None
-    image = soup.find("img")
-    if image:
-        url = image["src"]
+    description = None
+    for para in root.iter("p"):
+        description = " ".join(para.text_content().split())
+        break
+    url = None
+    alt = None
+    for image in root.iter("img"):
+        url = image.get("src")
         alt = image.get("alt")
-    else:
-        url = None
-        alt = None
+        break
     return OgProperties(description, url, alt)
 
 
-def generate_feed_str(builder, feed_path, title, entries):
-    blog_author = builder.config.root_get("author")
-    url = builder.config.root_get("canonical_url") or "http://localhost/"
-    feed_url = urljoin(url, feed_path)
-    feed = FeedGenerator()
-    feed.id(feed_url)
-    feed.title(title)
-    feed.author(name=blog_author)
-    feed.language("en")
-    feed.link(href=url)
-    feed.link(href=feed_url, rel="self")
-
-    entries = sorted(entries, key=lambda x: x.pub_date, reverse=True)[:10]
-    feed.updated(entries[0].pub_date.astimezone())
-
+def get_entries_digest(entries, *parts):
+    """Returns a digest of `parts` and of what listings of pages can show of
+    `entries`: their URL, title, publication date and tags, and the digest of
+    their source files, which changes with everything prepared from them,
+    like their summary or description. Listing templates must not show
+    anything else of the entries, such as their configuration, or their
+    pages would not be rewritten when it changes."""
     for entry in entries:
-        entry_url = urljoin(url, entry.slug)
-        content = fix_relative_urls(url, entry.slug, entry.render_contents())
-        categories = [{"term": x} for x in sorted(entry.tags)]
-        pub_date = entry.pub_date.astimezone()
-
-        feed_entry = feed.add_entry()
-        feed_entry.id(entry_url)
-        feed_entry.title(entry.title)
-        feed_entry.link(href=entry_url, rel="alternate")
-        feed_entry.published(pub_date)
-        feed_entry.updated(pub_date)
-        feed_entry.category(categories)
-        feed_entry.content(content=content, type="html")
-
-    return str(feed.atom_str(pretty=True), "utf-8")
+        parts += (
+            entry.slug,
+            entry.title,
+            entry.pub_date,
+            sorted(getattr(entry, "tags", ())),
+            entry.builder.manifest.get_digest(entry.source_filename),
+        )
+    return make_key(*parts)
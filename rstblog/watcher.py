@@ -0,0 +1,203 @@
+"""
+rstblog.watcher
+~~~~~~~~~~~~~~~
+
+Watches the project folder for changes, so that the development server does
+not have to walk the whole tree to find out if something must be rebuilt.
+
+:copyright: (c) 2026 by Aurélien Gâteau.
+:license: BSD, see LICENSE for more details.
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+import sys
+import threading
+import time
+
+logger = logging
+
+# From <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+)
+
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class Watcher:
+    """Base class for watchers. Changed paths are accumulated in a dirty set
+    until `pop_changes()` is called. Changes to the whole folder, like when
+    events have been lost, are reported as a change of the folder itself."""
+
+    def __init__(self, folder, ignored_folders=()):
+        self.folder = os.path.abspath(folder)
+        self.ignored_folders = [os.path.abspath(x) for x in ignored_folders]
+        self.changed = threading.Event()
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.watch, daemon=True)
+        self._thread.start()
+
+    def watch(self):
+        raise NotImplementedError()
+
+    def is_ignored(self, path):
+        for folder in self.ignored_folders:
+            if path == folder or path.startswith(folder + os.sep):
+                return True
+        return False
+
+    def add_change(self, path):
+        if self.is_ignored(path):
+            return
+        with self._lock:
+            self._dirty.add(path)
+        self.changed.set()
+
+    def pop_changes(self):
+        """Returns the paths which changed since the last call"""
+        with self._lock:
+            dirty = self._dirty
+            self._dirty = set()
+            self.changed.clear()
+        return dirty
+
+
+class PollingWatcher(Watcher):
+    """Detects changes by scanning the project folder every `interval`
+    seconds"""
+
+    def __init__(self, folder, ignored_folders=(), interval=1.0):
+        super().__init__(folder, ignored_folders)
+        self.interval = interval
+        self._snapshot = self.scan()
+
+    def scan(self):
+        snapshot = {}
+
+        def _walk(dirpath):
+            with os.scandir(dirpath) as it:
+                for entry in it:
+                    if self.is_ignored(entry.path):
+                        continue
+                    try:
+                        if entry.is_dir():
+                            _walk(entry.path)
+                        else:
+                            stat = entry.stat()
+                            snapshot[entry.path] = (stat.st_mtime_ns, stat.st_size)
+                    except FileNotFoundError:
+                        # Removed while we were scanning
+                        continue
+
+        _walk(self.folder)
+        return snapshot
+
+    def watch(self):
+        while True:
+            time.sleep(self.interval)
+            snapshot = self.scan()
+            for path in snapshot.keys() ^ self._snapshot.keys():
+                self.add_change(path)
+            for path, info in snapshot.items():
+                if self._snapshot.get(path, info) != info:
+                    self.add_change(path)
+            self._snapshot = snapshot
+
+
+class InotifyWatcher(Watcher):
+    """Detects changes using Linux inotify"""
+
+    def __init__(self, folder, ignored_folders=()):
+        super().__init__(folder, ignored_folders)
+        libc_name = ctypes.util.find_library("c")
+        if not sys.platform.startswith("linux") or libc_name is None:
+            raise OSError("inotify is not available")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self._paths_for_wd = {}
+        self.add_watches(self.folder)
+
+    def add_watches(self, folder):
+        """Watches `folder` and its sub folders"""
+        for dirpath, dirnames, filenames in os.walk(folder):
+            dirnames[:] = [
+                x for x in dirnames if not self.is_ignored(os.path.join(dirpath, x))
+            ]
+            wd = self._libc.inotify_add_watch(
+                self._fd, os.fsencode(dirpath), WATCH_MASK
+            )
+            if wd < 0:
+                errno = ctypes.get_errno()
+                raise OSError(errno, os.strerror(errno), dirpath)
+            self._paths_for_wd[wd] = dirpath
+
+    def watch(self):
+        while True:
+            data = os.read(self._fd, 64 * 1024)
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = data[offset : offset + length].rstrip(b"\0")
+                offset += length
+                self.process_event(wd, mask, os.fsdecode(name))
+
+    def process_event(self, wd, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            # Events have been lost, consider the whole tree dirty
+            self.add_change(self.folder)
+            return
+        dirpath = self._paths_for_wd.get(wd)
+        if dirpath is None:
+            return
+        if mask & IN_IGNORED:
+            del self._paths_for_wd[wd]
+            return
+        path = os.path.join(dirpath, name) if name else dirpath
+        if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+            if not self.is_ignored(path):
+                try:
+                    self.add_watches(path)
+                except OSError as exc:
+                    logger.warning("Cannot watch %s: %s", path, exc)
+        self.add_change(path)
+
+
+def create_watcher(folder, ignored_folders=()):
+    """Returns an inotify watcher if possible, a polling one otherwise"""
+    try:
+        return InotifyWatcher(folder, ignored_folders)
+    except OSError as exc:
+        logger.info("Falling back to polling for changes: %s", exc)
+        return PollingWatcher(folder, ignored_folders)
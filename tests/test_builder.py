@@ -0,0 +1,501 @@
+"""
+Builds small projects and checks what each build writes.
+"""
+
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import PIL.Image
+
+from rstblog.cli import get_builder
+from rstblog.signals import signals
+
+CONFIG = """\
+canonical_url: http://example.com/
+thumbnails:
+  jobs: 1
+"""
+
+LAYOUT = "<html><body>{% block body %}{% endblock %}</body></html>\n"
+
+
+def disconnect_modules():
+    """Modules connect to the signals when a builder sets them up, and stay
+    connected for the other builders of the process"""
+    for signal in signals.values():
+        for receiver in list(signal.receivers_for(None)):
+            signal.disconnect(receiver)
+
+
+class BuildTestCase(unittest.TestCase):
+    """Runs builds of a project created in a temporary folder"""
+
+    config = CONFIG
+
+    def setUp(self):
+        self.project_folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.project_folder)
+        self.addCleanup(disconnect_modules)
+        self.write("config.yml", self.config)
+        self.write("_templates/layout.html", LAYOUT)
+
+    def get_path(self, relpath):
+        return os.path.join(self.project_folder, relpath)
+
+    def write(self, relpath, content):
+        path = self.get_path(relpath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+
+    def read(self, relpath):
+        with open(self.get_path(relpath)) as f:
+            return f.read()
+
+    def write_entry(self, summary):
+        """Writes a blog entry tagged "news" to page.md"""
+        self.write(
+            "page.md",
+            "title: Page\n"
+            "pub_date: 2024-01-02 10:00:00\n"
+            "tags: [news]\n"
+            "summary: %s\n"
+            "\n"
+            "Hello\n" % summary,
+        )
+
+    def check_rewritten_when_summary_changes(self, relpath):
+        """Checks that the page listing entries at `relpath` is only
+        rewritten when the summary of an entry changes"""
+        self.write_entry("First")
+        self.build()
+        self.assertIn("First", self.read(relpath))
+        mtime = os.stat(self.get_path(relpath)).st_mtime_ns
+
+        self.build()
+        self.assertEqual(os.stat(self.get_path(relpath)).st_mtime_ns, mtime)
+
+        self.write_entry("Second")
+        self.build()
+        self.assertIn("Second", self.read(relpath))
+
+    def build(self, **kwargs):
+        """Builds the project, returns what the build printed. The builder
+        is kept in `self.builder`."""
+        self.builder = get_builder(self.project_folder)
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            self.builder.run(**kwargs)
+        return out.getvalue()
+
+
+class IncrementalBuildTestCase(BuildTestCase):
+    config = CONFIG + "active_modules: [blog, tags]\n"
+
+    def setUp(self):
+        super().setUp()
+        self.write(
+            "page.md",
+            "title: Page\npub_date: 2024-01-02 10:00:00\ntags: [news]\n\nHello\n",
+        )
+        self.write("static.txt", "Static\n")
+        self.write("_templates/blog/year_archive.html", "{{ entry.year }}\n")
+
+    def get_output_mtimes(self):
+        rv = {}
+        for dirpath, dirnames, filenames in os.walk(self.get_path("_build")):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                rv[path] = os.stat(path).st_mtime_ns
+        return rv
+
+    def read_page(self):
+        with open(self.get_path("_build/page/index.html")) as f:
+            return f.read()
+
+    def test_second_build_writes_nothing(self):
+        output = self.build()
+        self.assertIn("A page.md", output)
+        self.assertIn("A static.txt", output)
+        mtimes = self.get_output_mtimes()
+        self.assertIn(self.get_path("_build/tags/news/index.html"), mtimes)
+        self.assertIn(self.get_path("_build/feed.atom"), mtimes)
+
+        self.assertEqual(self.build(), "")
+        self.assertNotIn("output bytes written", self.builder.stats.counters)
+        self.assertEqual(self.get_output_mtimes(), mtimes)
+
+    def test_template_change(self):
+        self.build()
+        self.write(
+            "_templates/layout.html", "<main>{% block body %}{% endblock %}</main>"
+        )
+        self.assertEqual(self.build(), "U page.md\n")
+        self.assertIn("<main>", self.read_page())
+
+    def test_metadata_file_change(self):
+        self.build()
+        self.assertIn("<h1>Page</h1>", self.read_page())
+        self.write("page.yml", "hide_title: true\n")
+        self.assertEqual(self.build(), "U page.md\n")
+        self.assertNotIn("<h1>", self.read_page())
+
+    def test_folder_config_change(self):
+        self.write("sub/page.md", "title: Sub\n\nHello\n")
+        self.build()
+        self.write("sub/config.yml", "hide_title: true\n")
+        self.assertEqual(self.build(), "U sub/page.md\n")
+        with open(self.get_path("_build/sub/page/index.html")) as f:
+            self.assertNotIn("<h1>", f.read())
+
+    def test_switch_from_hardlinks_to_copies(self):
+        self.write("config.yml", self.config + "copy_strategy: hardlink\n")
+        self.build()
+        src = self.get_path("static.txt")
+        dst = self.get_path("_build/static.txt")
+        self.assertTrue(os.path.samefile(src, dst))
+
+        self.write("config.yml", self.config)
+        self.build()
+        self.assertFalse(os.path.samefile(src, dst))
+        self.write("static.txt", "Modified\n")
+        with open(dst) as f:
+            self.assertEqual(f.read(), "Static\n")
+
+
+class ContextTestCase(BuildTestCase):
+    config = CONFIG + "active_modules: [blog, tags]\n"
+
+    def test_no_instance_dict(self):
+        self.write(
+            "page.md",
+            "title: Page\npub_date: 2024-01-02 10:00:00\ntags: [news]\n\nHello\n",
+        )
+        builder = get_builder(self.project_folder)
+        (context,) = builder.iter_contexts()
+        self.assertEqual(context.tags, frozenset(["news"]))
+        self.assertFalse(hasattr(context, "__dict__"))
+        context.extra["module"] = 1
+        with self.assertRaises(AttributeError):
+            context.module = 1
+
+
+class RstDirectivesTestCase(BuildTestCase):
+    def write_page(self, *notes):
+        blocks = ["Paragraph %d\n\n.. note::\n\n    Note %d\n" % (x, x) for x in notes]
+        self.write("page.md", "title: Page\n\n" + "\n".join(blocks) + "\nEnd\n")
+
+    def test_rendered_in_one_pass(self):
+        self.write_page(1, 2)
+        self.build()
+        self.assertEqual(self.builder.stats.timings["docutils"][0], 1)
+        html = self.read("_build/page/index.html")
+        positions = [
+            html.index(x)
+            for x in ["Paragraph 1", "Note 1", "Paragraph 2", "Note 2", "End"]
+        ]
+        self.assertEqual(positions, sorted(positions))
+        self.assertEqual(html.count('class="admonition note"'), 2)
+
+        # Only the new directive is rendered
+        self.write_page(1, 2, 3)
+        self.build()
+        self.assertEqual(self.builder.stats.timings["docutils"][0], 1)
+        self.assertIn("Note 3", self.read("_build/page/index.html"))
+
+
+class CacheFolderTestCase(BuildTestCase):
+    def test_out_of_output_folder(self):
+        self.write("page.md", "title: Page\n\nHello\n")
+        self.build()
+        self.assertEqual(os.listdir(self.get_path("_build")), ["page"])
+        self.assertTrue(os.path.isfile(self.get_path(".rstblog-cache/manifest")))
+
+    def test_never_walked(self):
+        self.write(
+            "config.yml",
+            self.config + "cache_folder: cache\nignore_files: ['_templates']\n",
+        )
+        self.write("page.md", "title: Page\n\nHello\n")
+        self.build()
+        self.assertTrue(os.path.isfile(self.get_path("cache/manifest")))
+        self.assertEqual(self.build(), "")
+        self.assertEqual(
+            sorted(os.listdir(self.get_path("_build"))), ["config.yml", "page"]
+        )
+
+
+class PygmentsTestCase(BuildTestCase):
+    def write_config(self, style):
+        self.write(
+            "config.yml",
+            CONFIG
+            + "active_modules: [pygments]\n"
+            + "modules:\n  pygments:\n    style: %s\n" % style,
+        )
+
+    def test_stylesheet_only_written_when_the_style_changes(self):
+        self.write_config("default")
+        self.write(
+            "page.md",
+            "title: Page\n\n.. code-block:: python\n\n    print(1)\n\nEnd\n",
+        )
+        self.build()
+        self.assertIn(
+            '<span class="nb">print</span>', self.read("_build/page/index.html")
+        )
+        stylesheet = self.get_path("_build/static/_pygments.css")
+        mtime = os.stat(stylesheet).st_mtime_ns
+
+        self.write("page.md", "title: Page\n\nEdited\n")
+        self.build()
+        self.assertEqual(os.stat(stylesheet).st_mtime_ns, mtime)
+
+        self.write_config("monokai")
+        self.build()
+        self.assertNotEqual(os.stat(stylesheet).st_mtime_ns, mtime)
+
+
+class ScssTestCase(BuildTestCase):
+    def test_rebuilt_when_an_import_changes(self):
+        self.write("style.scss", '@import "colors";\nbody { color: $text; }\n')
+        self.write("_colors.scss", "$text: #123456;\n")
+        self.assertEqual(self.build(), "A style.scss\n")
+        self.assertIn("#123456", self.read("_build/style.css"))
+        self.assertIn("style.scss", self.read("_build/style.css.map"))
+
+        self.assertEqual(self.build(), "")
+        self.write("_colors.scss", "$text: #654321;\n")
+        self.assertEqual(self.build(), "U style.scss\n")
+        self.assertIn("#654321", self.read("_build/style.css"))
+
+
+class TemplateCacheTestCase(BuildTestCase):
+    def test_compiled_templates_are_reused(self):
+        self.write("page.md", "title: Page\n\nHello\n")
+        self.build()
+        self.assertIn("template compilation", self.builder.stats.timings)
+        self.assertTrue(os.listdir(self.get_path(".rstblog-cache/templates")))
+
+        self.write("page.md", "title: Page\n\nHello again\n")
+        self.assertEqual(self.build(), "U page.md\n")
+        self.assertNotIn("template compilation", self.builder.stats.timings)
+
+        self.write(
+            "_templates/layout.html", "<main>{% block body %}{% endblock %}</main>"
+        )
+        self.build()
+        self.assertIn("template compilation", self.builder.stats.timings)
+        self.assertIn("<main>", self.read("_build/page/index.html"))
+
+
+class ParallelBuildTestCase(BuildTestCase):
+    def test_prepares_pages_once(self):
+        for idx in range(3):
+            self.write("page%d.md" % idx, "title: Page %d\n\nHello\n" % idx)
+        output = self.build(jobs=2)
+        for idx in range(3):
+            self.assertIn("A page%d.md" % idx, output)
+        self.assertEqual(self.builder.stats.timings["prepare MarkdownProgram"][0], 3)
+        with open(self.get_path("_build/page1/index.html")) as f:
+            self.assertIn("<h1>Page 1</h1>", f.read())
+
+        self.assertEqual(self.build(jobs=2), "")
+
+    def test_profile_includes_the_workers(self):
+        for idx in range(3):
+            self.write("page%d.md" % idx, "title: Page %d\n\nHello\n" % idx)
+        builder = get_builder(self.project_folder)
+        builder.stats.profiling = True
+        with contextlib.redirect_stdout(io.StringIO()):
+            builder.run(jobs=2)
+        stats = builder.stats
+        self.assertEqual(stats.timings["build MarkdownProgram"][0], 3)
+        for idx in range(3):
+            self.assertIn("page%d.md" % idx, stats.file_timings)
+        pids = {x["pid"] for x in stats.events if x["name"] == "markdown"}
+        self.assertTrue(pids)
+        self.assertNotIn(os.getpid(), pids)
+
+
+class ParallelThumbnailTestCase(BuildTestCase):
+    config = CONFIG + "active_modules: [thumbimg]\n"
+
+    def test_generated_once(self):
+        PIL.Image.new("RGB", (800, 600), "red").save(self.get_path("a.jpg"))
+        for idx in range(4):
+            self.write(
+                "page%d.md" % idx, "title: Page %d\n\n.. thumbimg :: a.jpg\n" % idx
+            )
+        output = self.build(jobs=2)
+        self.assertEqual(output.count("Generating thumbnail"), 1)
+        for idx in range(4):
+            html = self.read("_build/page%d/index.html" % idx)
+            self.assertIn('src="/page%d/thumb_300_a.jpg"' % idx, html)
+
+        self.write("page0.md", "title: Page 0\n\n.. thumbimg :: a.jpg\n\nEdited\n")
+        output = self.build(jobs=2)
+        self.assertIn("U page0.md", output)
+        self.assertNotIn("Generating thumbnail", output)
+
+
+class AnythingNeedsBuildTestCase(BuildTestCase):
+    def test_after_build(self):
+        self.write("page.md", "title: Page\n\nHello\n")
+        self.build()
+        self.assertFalse(get_builder(self.project_folder).anything_needs_build())
+
+        self.write("page.md", "title: Page\n\nHello again\n")
+        self.assertTrue(get_builder(self.project_folder).anything_needs_build())
+
+
+class RelevantChangesTestCase(BuildTestCase):
+    def test_ignored_by_folder_config(self):
+        self.write("sub/config.yml", "ignore_files: ['*.txt']\n")
+        paths = [
+            self.get_path("notes.txt"),
+            self.get_path("sub/notes.txt"),
+            self.get_path("sub/page.md"),
+            self.get_path("_drafts/page.md"),
+        ]
+        builder = get_builder(self.project_folder)
+        self.assertEqual(
+            builder.get_relevant_changes(paths),
+            {self.get_path("notes.txt"), self.get_path("sub/page.md")},
+        )
+
+    def test_keeps_project_folder(self):
+        # Reported by the watcher when it lost events
+        paths = [self.project_folder, self.get_path("page.md")]
+        builder = get_builder(self.project_folder)
+        self.assertEqual(builder.get_relevant_changes(paths), set(paths))
+
+    def test_changed_folder(self):
+        self.write("sub/page.md", "title: Old\n\nHello\n")
+        self.build()
+        # Only the folder is reported when it is moved into the project
+        self.write("sub/page.md", "title: New\n\nHello\n")
+        paths = get_builder(self.project_folder).get_relevant_changes(
+            [self.get_path("sub")]
+        )
+        self.assertEqual(paths, {self.get_path("sub")})
+        self.assertEqual(self.build(changes=paths), "U sub/page.md\n")
+        with open(self.get_path("_build/sub/page/index.html")) as f:
+            self.assertIn("<h1>New</h1>", f.read())
+
+
+class TagPagesTestCase(BuildTestCase):
+    config = CONFIG + "active_modules: [tags]\n"
+
+    def test_rewritten_when_summary_changes(self):
+        # Shows the summary of the entries, unlike the builtin template
+        self.write(
+            "_templates/tag.html",
+            "{% for entry in entries %}{{ entry.render_summary() }}{% endfor %}\n",
+        )
+        self.check_rewritten_when_summary_changes("_build/tags/news/index.html")
+
+
+class ArchivePagesTestCase(BuildTestCase):
+    config = CONFIG + "active_modules: [blog, tags]\n"
+
+    def test_rewritten_when_summary_changes(self):
+        self.write(
+            "_templates/blog/year_archive.html",
+            "{% for x in entry.entries %}{{ x.render_summary() }}{% endfor %}\n",
+        )
+        self.check_rewritten_when_summary_changes("_build/blog/2024/index.html")
+
+
+class ThumbnailTestCase(BuildTestCase):
+    config = CONFIG + "active_modules: [thumbimg, gallery]\n"
+
+    def test_same_image_at_two_sizes(self):
+        PIL.Image.new("RGB", (800, 600), "red").save(self.get_path("a.jpg"))
+        self.write(
+            "page.md",
+            "title: Page\n"
+            "\n"
+            ".. thumbimg :: a.jpg\n"
+            "\n"
+            "Between\n"
+            "\n"
+            ".. gallery ::\n"
+            "    :thumbsize: 100\n"
+            "\n"
+            "    - full: a.jpg\n"
+            "      alt: A\n"
+            "\n"
+            "After\n",
+        )
+
+        output = self.build()
+        self.assertEqual(output.count("Generating thumbnail"), 2)
+        with PIL.Image.open(self.get_path("thumb_300_a.jpg")) as image:
+            self.assertEqual(image.size, (300, 225))
+        with PIL.Image.open(self.get_path("thumb_100_a.jpg")) as image:
+            self.assertEqual(image.size, (100, 75))
+
+        output = self.build()
+        self.assertNotIn("Generating thumbnail", output)
+        self.assertNotIn("page.md", output)
+
+    def test_lost_index(self):
+        PIL.Image.new("RGB", (800, 600), "red").save(self.get_path("a.jpg"))
+        self.write("page.md", "title: Page\n\n.. thumbimg :: a.jpg\n")
+        self.build()
+        os.unlink(self.get_path(".rstblog-cache/thumbnails"))
+        self.write("page.md", "title: Page\n\n.. thumbimg :: a.jpg\n\nEdited\n")
+        output = self.build()
+        self.assertIn("U page.md", output)
+        self.assertNotIn("Generating thumbnail", output)
+        self.assertTrue(os.path.isfile(self.get_path(".rstblog-cache/thumbnails")))
+
+    def test_removes_legacy_thumbnails(self):
+        PIL.Image.new("RGB", (800, 600), "red").save(self.get_path("a.jpg"))
+        PIL.Image.new("RGB", (300, 225), "red").save(self.get_path("thumb_a.jpg"))
+        self.write("page.md", "title: Page\n\n.. thumbimg :: a.jpg\n")
+        output = self.build()
+        self.assertIn("Removed legacy thumbnail", output)
+        self.assertFalse(os.path.exists(self.get_path("thumb_a.jpg")))
+        self.assertTrue(os.path.isfile(self.get_path("thumb_300_a.jpg")))
+
+    def test_densities_and_formats(self):
+        self.write(
+            "config.yml",
+            CONFIG
+            + "  densities: [1, 2]\n"
+            + "  formats: [webp]\n"
+            + "active_modules: [thumbimg]\n",
+        )
+        PIL.Image.new("RGB", (800, 600), "red").save(self.get_path("a.jpg"))
+        self.write("page.md", "title: Page\n\n.. thumbimg :: a.jpg\n")
+
+        self.build()
+        for relpath, format, size in [
+            ("thumb_300_a.jpg", "JPEG", (300, 225)),
+            ("thumb_300_a@2x.jpg", "JPEG", (600, 450)),
+            ("thumb_300_a.jpg.webp", "WEBP", (300, 225)),
+            ("thumb_300_a@2x.jpg.webp", "WEBP", (600, 450)),
+        ]:
+            with PIL.Image.open(self.get_path(relpath)) as image:
+                self.assertEqual((image.format, image.size), (format, size))
+
+        html = self.read("_build/page/index.html")
+        self.assertIn("<picture>", html)
+        self.assertIn(
+            '<source type="image/webp"'
+            ' srcset="/page/thumb_300_a.jpg.webp 1x, /page/thumb_300_a@2x.jpg.webp 2x"',
+            html,
+        )
+        self.assertIn(
+            'srcset="/page/thumb_300_a.jpg 1x, /page/thumb_300_a@2x.jpg 2x"', html
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+"""
+Tests the render cache.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from rstblog.cache import RenderCache
+
+
+class RenderCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        self.filename = os.path.join(self.folder, "render-cache")
+        self.input_filename = os.path.join(self.folder, "input.yml")
+        with open(self.input_filename, "w") as f:
+            f.write("a: 1\n")
+
+    def load(self, max_size=1024 * 1024):
+        cache = RenderCache(self.filename, max_size)
+        cache.load()
+        return cache
+
+    def test_values_depend_on_files(self):
+        cache = self.load()
+        cache.set("a", "A", [self.input_filename])
+        cache.set("b", "B")
+        cache.save()
+
+        cache = self.load()
+        self.assertEqual(cache.get("a"), "A")
+        os.utime(self.input_filename, ns=(0, 0))
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("b"), "B")
+
+    def test_using_values_does_not_rewrite_them(self):
+        cache = self.load()
+        for key in "abc":
+            cache.set(key, key.upper())
+        cache.save()
+        os.utime(self.filename, ns=(0, 0))
+
+        cache = self.load()
+        cache.get("a")
+        cache.save()
+        self.assertEqual(os.stat(self.filename).st_mtime_ns, 0)
+
+        # The order is kept: "b" is now the least recently used value
+        cache = self.load()
+        self.assertEqual(list(cache.entries), ["b", "c", "a"])
+        cache.max_size = cache.size
+        cache.set("d", "D")
+        self.assertEqual(list(cache.entries), ["c", "a", "d"])
+        cache.save()
+
+        cache = self.load()
+        self.assertEqual(list(cache.entries), ["c", "a", "d"])
+        self.assertFalse(os.path.exists(cache.order_filename))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+"""
+Tests the stacked configuration.
+"""
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from rstblog.config import Config
+
+
+def make_config(*layers):
+    config = Config()
+    for layer in layers:
+        config = config.add_from_dict(layer)
+    return config
+
+
+class ConfigTestCase(unittest.TestCase):
+    def test_layers_override_the_ones_below(self):
+        root = make_config({"title": "Root", "feed": {"name": "Blog"}})
+        child = root.add_from_dict({"title": "Child"})
+        self.assertEqual(child["title"], "Child")
+        self.assertEqual(child.get("feed.name"), "Blog")
+        self.assertEqual(root["title"], "Root")
+        self.assertIsNone(child.get("missing"))
+        with self.assertRaises(KeyError):
+            child["missing"]
+
+    def test_root_get_reads_the_bottom_layer(self):
+        config = make_config({"author": "Root"}, {"author": "Child", "extra": 1})
+        self.assertEqual(config.root_get("author"), "Root")
+        self.assertEqual(config.root_get("extra", "default"), "default")
+        self.assertEqual(Config().root_get("author", "default"), "default")
+
+    def test_list_entries(self):
+        config = make_config(
+            {"programs": {"*.md": "md", "*.txt": "copy"}},
+            {"programs": {"*.txt": "html"}, "other": 1},
+        )
+        self.assertEqual(
+            config.list_entries("programs"),
+            {"programs.*.md": "md", "programs.*.txt": "html"},
+        )
+
+    def test_merged_get(self):
+        root = make_config({"ignore_files": ["*.txt"], "tags": ["a"]})
+        child = root.add_from_dict({"ignore_files": ["*.log"]})
+        self.assertEqual(child.merged_get("ignore_files"), ["*.log", "*.txt"])
+        self.assertEqual(child.merged_get("tags"), ["a"])
+        self.assertIsNone(child.merged_get("missing"))
+        # Merging does not modify the layers
+        self.assertEqual(root.merged_get("ignore_files"), ["*.txt"])
+
+    def test_without_top_layer_does_not_modify_the_config(self):
+        root = make_config({"title": "Root"})
+        child = root.add_from_dict({"title": "Child"})
+        grandchild = child.add_from_dict({"extra": 1})
+        parent = child.without_top_layer()
+        self.assertIs(parent, root)
+        self.assertEqual(child["title"], "Child")
+        self.assertEqual(grandchild["title"], "Child")
+        self.assertEqual(parent["title"], "Root")
+
+    def test_without_top_layer_without_layers(self):
+        with self.assertRaises(IndexError):
+            Config().without_top_layer()
+
+    def test_add_from_file_records_filenames(self):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        filename = os.path.join(folder, "config.yml")
+        with open(filename, "w") as f:
+            f.write("title: Root\n")
+        with open(filename) as f:
+            config = Config().add_from_file(f)
+        self.assertEqual(config["title"], "Root")
+        self.assertEqual(config.filenames, [filename])
+
+        child = config.add_from_file(io.StringIO("title: Child\n"))
+        self.assertEqual(child["title"], "Child")
+        self.assertEqual(child.filenames, [filename])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,217 @@
+"""
+Compares the Atom feeds written by rstblog.feeds with the ones feedgen, which
+rstblog used before, generates from the same entries, and checks the RSS
+feeds. Also checks that the feeds of a build share their entries.
+
+Intended differences with feedgen:
+
+- there is no <generator> element;
+- each entry has an <author>, like the feed;
+- feeds without entries get an <updated> element set to the current time.
+"""
+
+import io
+import unittest
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from urllib.parse import urljoin
+
+from feedgen.feed import FeedGenerator
+from lxml import etree
+
+from rstblog.feeds import write_atom_feed, write_rss_feed
+
+ATOM = "{http://www.w3.org/2005/Atom}"
+
+URL = "http://example.com/blog/"
+
+
+class FakeConfig:
+    def __init__(self, values):
+        self.values = values
+
+    def root_get(self, key, default=None):
+        return self.values.get(key, default)
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+
+class FakeBuilder:
+    def __init__(self, **values):
+        self.config = FakeConfig(values)
+        self.storage = {}
+
+    def get_storage(self, name):
+        return self.storage.setdefault(name, {})
+
+
+class FakeEntry:
+    def __init__(self, slug, title, pub_date, tags, contents):
+        self.slug = slug
+        self.title = title
+        self.pub_date = pub_date
+        self.tags = tags
+        self.contents = contents
+        self.render_count = 0
+
+    def render_contents(self):
+        return self.contents
+
+    def render_absolute_contents(self, url):
+        self.render_count += 1
+        return self.contents
+
+
+def make_entries(count):
+    start = datetime(2024, 1, 2, 10, 0, tzinfo=timezone.utc)
+    return [
+        FakeEntry(
+            "posts/%d/" % idx,
+            'Post <%d> & "friends"' % idx,
+            start + timedelta(days=idx, hours=idx),
+            ["tag%d" % (idx % 3), "c&d"],
+            '<p>Body of <a href="%s">post %d</a> &amp; more</p>' % (URL, idx),
+        )
+        for idx in range(count)
+    ]
+
+
+def generate_feedgen_feed(feed_path, title, author, entries):
+    """Generates the feed the way rstblog did with feedgen"""
+    feed_url = urljoin(URL, feed_path)
+    feed = FeedGenerator()
+    feed.id(feed_url)
+    feed.title(title)
+    feed.author(name=author)
+    feed.language("en")
+    feed.link(href=URL)
+    feed.link(href=feed_url, rel="self")
+
+    entries = sorted(entries, key=lambda x: x.pub_date, reverse=True)[:10]
+    if entries:
+        feed.updated(entries[0].pub_date.astimezone())
+
+    for entry in entries:
+        entry_url = urljoin(URL, entry.slug)
+        pub_date = entry.pub_date.astimezone()
+        feed_entry = feed.add_entry()
+        feed_entry.id(entry_url)
+        feed_entry.title(entry.title)
+        # Intended difference: entries have an author
+        feed_entry.author(name=author)
+        feed_entry.link(href=entry_url, rel="alternate")
+        feed_entry.published(pub_date)
+        feed_entry.updated(pub_date)
+        feed_entry.category([{"term": x} for x in sorted(entry.tags)])
+        feed_entry.content(content=entry.render_contents(), type="html")
+    return feed.atom_str(pretty=True)
+
+
+def normalize(element, ignore_updated=False):
+    """Returns the parsed `element` as nested tuples, without the elements
+    which are intentionally different"""
+    children = []
+    for child in element:
+        if child.tag == ATOM + "generator":
+            continue
+        if ignore_updated and child.tag == ATOM + "updated":
+            children.append((child.tag,))
+            continue
+        children.append(normalize(child, ignore_updated))
+    return (
+        element.tag,
+        sorted(element.attrib.items()),
+        (element.text or "").strip(),
+        children,
+    )
+
+
+class AtomFeedTestCase(unittest.TestCase):
+    def check_feed(self, entries, ignore_updated=False):
+        builder = FakeBuilder(author="Jane <Doe> & co", canonical_url=URL)
+        title = "Recent <posts> & news"
+        f = io.StringIO()
+        write_atom_feed(f, builder, "feed.atom", title, entries)
+        written = etree.fromstring(f.getvalue().encode("utf-8"))
+        expected = etree.fromstring(
+            generate_feedgen_feed("feed.atom", title, "Jane <Doe> & co", entries)
+        )
+        self.assertEqual(
+            normalize(written, ignore_updated), normalize(expected, ignore_updated)
+        )
+
+    def test_matches_feedgen(self):
+        self.check_feed(make_entries(3))
+
+    def test_keeps_most_recent_entries(self):
+        self.check_feed(make_entries(15))
+
+    def test_empty_feed(self):
+        self.check_feed([], ignore_updated=True)
+
+
+class RssFeedTestCase(unittest.TestCase):
+    def write_feed(self, entries):
+        builder = FakeBuilder(canonical_url=URL)
+        f = io.StringIO()
+        write_rss_feed(f, builder, "feed.rss", "Recent <posts>", entries)
+        return etree.fromstring(f.getvalue().encode("utf-8"))
+
+    def test_items(self):
+        entries = make_entries(15)
+        channel = self.write_feed(entries).find("channel")
+        self.assertEqual(channel.findtext("title"), "Recent <posts>")
+        self.assertEqual(channel.findtext("link"), URL)
+        self.assertEqual(
+            channel.find(ATOM + "link").get("href"), urljoin(URL, "feed.rss")
+        )
+
+        # Most recent entries first
+        items = channel.findall("item")
+        self.assertEqual(len(items), 10)
+        expected = sorted(entries, key=lambda x: x.pub_date, reverse=True)[:10]
+        for item, entry in zip(items, expected):
+            entry_url = urljoin(URL, entry.slug)
+            self.assertEqual(item.findtext("title"), entry.title)
+            self.assertEqual(item.findtext("link"), entry_url)
+            self.assertEqual(item.findtext("guid"), entry_url)
+            self.assertEqual(item.findtext("description"), entry.contents)
+            self.assertEqual(
+                [x.text for x in item.findall("category")], sorted(entry.tags)
+            )
+        self.assertEqual(
+            channel.findtext("lastBuildDate"), items[0].findtext("pubDate")
+        )
+        self.assertEqual(
+            items[0].findtext("pubDate"),
+            format_datetime(expected[0].pub_date.astimezone()),
+        )
+
+    def test_empty_feed(self):
+        channel = self.write_feed([]).find("channel")
+        self.assertEqual(channel.findall("item"), [])
+        self.assertIsNone(channel.find("lastBuildDate"))
+
+
+class SharedEntriesTestCase(unittest.TestCase):
+    def test_entries_are_rendered_once_per_build(self):
+        builder = FakeBuilder(canonical_url=URL)
+        entries = make_entries(3)
+        # A blog feed and a tag feed, in both formats
+        for path, feed_entries in [("feed", entries), ("tags/a/feed", entries[:2])]:
+            write_atom_feed(
+                io.StringIO(), builder, path + ".atom", "Feed", feed_entries
+            )
+            write_rss_feed(io.StringIO(), builder, path + ".rss", "Feed", feed_entries)
+        self.assertEqual([x.render_count for x in entries], [1, 1, 1])
+
+        # The next build renders them again
+        write_atom_feed(
+            io.StringIO(), FakeBuilder(canonical_url=URL), "feed.atom", "Feed", entries
+        )
+        self.assertEqual([x.render_count for x in entries], [2, 2, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+"""
+Tests the syntax highlighting cache.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import pygments
+from pygments.formatters import HtmlFormatter
+from pygments.util import ClassNotFound
+
+from rstblog import highlight
+from rstblog.cache import RenderCache
+
+
+class HighlightTestCase(unittest.TestCase):
+    def setUp(self):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        self.cache = RenderCache(os.path.join(folder, "render-cache"), 1024 * 1024)
+        highlight.set_cache(self.cache)
+        self.addCleanup(highlight.set_cache, None)
+
+    def test_cache_hit(self):
+        lexer = highlight.get_lexer("python")
+        formatter = HtmlFormatter()
+        with mock.patch("pygments.highlight", wraps=pygments.highlight) as wrapper:
+            html = highlight.highlight("print(1)\n", lexer, formatter)
+            self.assertIn('<span class="nb">print</span>', html)
+            self.assertEqual(highlight.highlight("print(1)\n", lexer, formatter), html)
+            self.assertEqual(wrapper.call_count, 1)
+
+            # The key depends on the code, the lexer and the formatter
+            highlight.highlight("print(2)\n", lexer, formatter)
+            highlight.highlight("print(1)\n", highlight.get_lexer("text"), formatter)
+            highlight.highlight("print(1)\n", lexer, HtmlFormatter(linenos=True))
+            self.assertEqual(wrapper.call_count, 4)
+
+    def test_lexers_are_reused(self):
+        lexer = highlight.get_lexer("python")
+        self.assertIs(highlight.get_lexer("python"), lexer)
+        self.assertIsNot(highlight.get_lexer("python", stripnl=False), lexer)
+        for _ in range(2):
+            with self.assertRaises(ClassNotFound):
+                highlight.get_lexer("no-such-language")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+"""
+Tests the build manifest.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from rstblog.manifest import Manifest
+
+
+class ManifestTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        self.filename = os.path.join(self.folder, "cache", "manifest")
+        self.input_filename = self.write("input.yml", "a: 1\n")
+
+    def write(self, name, content):
+        path = os.path.join(self.folder, name)
+        with open(path, "w") as f:
+            f.write(content)
+        return path
+
+    def test_get_returns_a_copy_of_the_state(self):
+        manifest = Manifest(self.filename)
+        manifest.put("page.md", "digest", {"title": "Page"})
+        state = manifest.get("page.md", "digest")
+        self.assertEqual(state, {"title": "Page"})
+        state["title"] = "Modified"
+        self.assertEqual(manifest.get("page.md", "digest"), {"title": "Page"})
+
+    def test_get_checks_the_digest_and_inputs(self):
+        manifest = Manifest(self.filename)
+        manifest.put("page.md", "digest", {"title": "Page"}, [self.input_filename])
+        self.assertIsNone(manifest.get("page.md", "other"))
+        self.assertIsNone(manifest.get("other.md", "digest"))
+
+        os.utime(self.input_filename, ns=(0, 0))
+        self.assertIsNone(manifest.get("page.md", "digest"))
+
+    def test_save_keeps_seen_entries(self):
+        manifest = Manifest(self.filename)
+        manifest.put("page.md", "digest", {"title": "Page"})
+        manifest.put("removed.md", "digest", {"title": "Removed"})
+        manifest.save()
+
+        manifest = Manifest(self.filename)
+        manifest.load()
+        self.assertEqual(manifest.get("page.md", "digest"), {"title": "Page"})
+        manifest.save()
+
+        manifest = Manifest(self.filename)
+        manifest.load()
+        self.assertEqual(manifest.get_digest("page.md"), "digest")
+        self.assertIsNone(manifest.get_digest("removed.md"))
+
+    def test_save_only_writes_changes(self):
+        manifest = Manifest(self.filename)
+        manifest.put("page.md", "digest", {"title": "Page"})
+        manifest.save()
+        os.utime(self.filename, ns=(0, 0))
+
+        manifest.load()
+        manifest.get("page.md", "digest")
+        manifest.save()
+        self.assertEqual(os.stat(self.filename).st_mtime_ns, 0)
+
+        manifest.load()
+        manifest.save()
+        manifest.load()
+        self.assertIsNone(manifest.get_digest("page.md"))
+
+    def test_salt_invalidates_saved_entries(self):
+        manifest = Manifest(self.filename, salt="a")
+        manifest.put("page.md", "digest", {"title": "Page"})
+        manifest.save()
+
+        manifest = Manifest(self.filename, salt="b")
+        manifest.load()
+        self.assertIsNone(manifest.get("page.md", "digest"))
+
+    def test_built(self):
+        manifest = Manifest(self.filename)
+        self.assertIsNone(manifest.get_built("page.md"))
+        manifest.set_built("page.md", {"page.md": 1.0}, [self.input_filename])
+        self.assertEqual(
+            manifest.get_built("page.md"),
+            {
+                "page.md": 1.0,
+                self.input_filename: os.path.getmtime(self.input_filename),
+            },
+        )
+        self.assertIn(self.input_filename, manifest.get_used_files())
+
+    def test_outputs(self):
+        manifest = Manifest(self.filename)
+        output = self.write("tags.html", "Tags")
+        self.assertFalse(manifest.is_output_up_to_date(output, "digest"))
+
+        manifest.set_output(output, "digest", [self.input_filename])
+        self.assertTrue(manifest.is_output_up_to_date(output, "digest"))
+        self.assertFalse(manifest.is_output_up_to_date(output, "other"))
+
+        os.utime(self.input_filename, ns=(0, 0))
+        self.assertFalse(manifest.is_output_up_to_date(output, "digest"))
+
+        manifest.set_output(output, "digest", [self.input_filename])
+        os.utime(output, ns=(0, 0))
+        self.assertFalse(manifest.is_output_up_to_date(output, "digest"))
+
+
+if __name__ == "__main__":
+    unittest.main()
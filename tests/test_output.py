@@ -0,0 +1,124 @@
+"""
+Tests writing output files and the copy strategies.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from rstblog.output import OutputWriter
+from rstblog.stats import BuildStats
+
+
+class OutputTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        self.stats = BuildStats()
+
+    def get_path(self, name):
+        return os.path.join(self.folder, name)
+
+    def write_source(self, content="source\n"):
+        path = self.get_path("src.txt")
+        with open(path, "w") as f:
+            f.write(content)
+        return path
+
+    def read(self, path):
+        with open(path) as f:
+            return f.read()
+
+
+class OpenTestCase(OutputTestCase):
+    def test_only_replaces_changed_files(self):
+        writer = OutputWriter(self.stats)
+        path = self.get_path("sub/page.html")
+        with writer.open(path) as f:
+            f.write("Hello")
+        self.assertEqual(self.read(path), "Hello")
+        os.utime(path, ns=(0, 0))
+
+        with writer.open(path) as f:
+            f.write("Hello")
+        self.assertEqual(os.stat(path).st_mtime_ns, 0)
+        self.assertEqual(self.stats.counters["output bytes unchanged"], [1, 5])
+
+        with writer.open(path) as f:
+            f.write("Hello again")
+        self.assertEqual(self.read(path), "Hello again")
+        self.assertEqual(self.stats.counters["output bytes written"], [2, 16])
+
+    def test_failed_write_keeps_the_file(self):
+        writer = OutputWriter(self.stats)
+        path = self.get_path("page.html")
+        with writer.open(path) as f:
+            f.write("Hello")
+        with self.assertRaises(RuntimeError):
+            with writer.open(path) as f:
+                f.write("Partial")
+                raise RuntimeError()
+        self.assertEqual(self.read(path), "Hello")
+        self.assertEqual(os.listdir(self.folder), ["page.html"])
+
+
+class CopyTestCase(OutputTestCase):
+    def test_copy(self):
+        src = self.write_source()
+        dst = self.get_path("out/dst.txt")
+        OutputWriter(self.stats).copy(src, dst)
+        self.assertEqual(self.read(dst), "source\n")
+        self.assertFalse(os.path.samefile(src, dst))
+
+    def test_hardlink(self):
+        src = self.write_source()
+        dst = self.get_path("dst.txt")
+        writer = OutputWriter(self.stats, "hardlink")
+        writer.copy(src, dst)
+        self.assertTrue(os.path.samefile(src, dst))
+
+        writer.copy(src, dst)
+        self.assertEqual(self.stats.counters["output bytes unchanged"], [1, 7])
+
+    def test_symlink(self):
+        src = self.write_source()
+        dst = self.get_path("dst.txt")
+        OutputWriter(self.stats, "symlink").copy(src, dst)
+        self.assertTrue(os.path.islink(dst))
+        self.assertEqual(os.readlink(dst), src)
+
+    def test_reflink(self):
+        src = self.write_source()
+        dst = self.get_path("dst.txt")
+        OutputWriter(self.stats, "reflink").copy(src, dst)
+        self.assertEqual(self.read(dst), "source\n")
+        self.assertFalse(os.path.samefile(src, dst))
+        self.assertFalse(os.path.islink(dst))
+
+    def test_copy_replaces_hardlinks(self):
+        src = self.write_source()
+        dst = self.get_path("dst.txt")
+        OutputWriter(self.stats, "hardlink").copy(src, dst)
+        OutputWriter(self.stats, "copy").copy(src, dst)
+        self.assertFalse(os.path.samefile(src, dst))
+
+        # Modifying the source no longer modifies the output
+        self.write_source("modified\n")
+        self.assertEqual(self.read(dst), "source\n")
+
+    def test_copy_replaces_symlinks(self):
+        src = self.write_source()
+        dst = self.get_path("dst.txt")
+        OutputWriter(self.stats, "symlink").copy(src, dst)
+        OutputWriter(self.stats, "copy").copy(src, dst)
+        self.assertFalse(os.path.islink(dst))
+        self.assertEqual(self.read(dst), "source\n")
+
+    def test_unknown_strategy(self):
+        with self.assertRaises(ValueError):
+            OutputWriter(self.stats, "teleport")
+
+
+if __name__ == "__main__":
+    unittest.main()
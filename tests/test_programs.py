@@ -0,0 +1,64 @@
+"""
+Tests the helpers of the programs.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from rstblog.programs import get_markdown_converter, get_scss_imports
+from rstblog.stats import BuildStats
+
+
+class MarkdownConverterTestCase(unittest.TestCase):
+    def test_created_once(self):
+        converter = get_markdown_converter(BuildStats())
+        stats = BuildStats()
+        self.assertIs(get_markdown_converter(stats), converter)
+        self.assertNotIn("markdown extensions setup", stats.timings)
+
+    def test_documents_do_not_share_state(self):
+        converter = get_markdown_converter(BuildStats())
+        html = converter.reset().convert("[Link][ref]\n\n[ref]: http://example.com/\n")
+        self.assertIn('href="http://example.com/"', html)
+        html = converter.reset().convert("[Link][ref]\n")
+        self.assertNotIn("href", html)
+
+    def test_extensions(self):
+        converter = get_markdown_converter(BuildStats())
+        html = converter.reset().convert("| a |\n|---|\n| b |\n\n```\ncode\n```\n")
+        self.assertIn("<table>", html)
+        self.assertIn("<code>code", html)
+
+
+class ScssImportsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+
+    def write(self, relpath, content):
+        path = os.path.join(self.folder, relpath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+        return path
+
+    def test_imports(self):
+        style = self.write(
+            "style.scss",
+            '@import "colors", "theme/base";\n'
+            '@use "loop.scss";\n'
+            '@import "print.css";\n'
+            '@import "missing";\n',
+        )
+        colors = self.write("_colors.scss", "$red: #f00;\n")
+        base = self.write("theme/base.scss", '@import "fonts";\n')
+        fonts = self.write("theme/_fonts.scss", "")
+        loop = self.write("_loop.scss", '@import "style";\n')
+        self.write("print.css", "")
+        self.assertEqual(get_scss_imports(style), {colors, base, fonts, loop, style})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+"""
+Tests the development server.
+"""
+
+import contextlib
+import http.client
+import io
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from rstblog.cli import get_builder
+from rstblog.server import EVENTS_PATH, LIVE_RELOAD_SCRIPT, Server
+from rstblog.signals import signals
+
+
+def disconnect_modules():
+    for signal in signals.values():
+        for receiver in list(signal.receivers_for(None)):
+            signal.disconnect(receiver)
+
+
+class ServerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.project_folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.project_folder)
+        self.addCleanup(disconnect_modules)
+        self.write("config.yml", "canonical_url: http://example.com/\n")
+        self.write(
+            "_templates/layout.html",
+            "<html><body>{% block body %}{% endblock %}</body></html>\n",
+        )
+        self.write("page.md", "title: Page\n\nHello\n")
+        self.write("static.txt", "Static\n")
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.server = Server("127.0.0.1", 0, get_builder(self.project_folder))
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def write(self, relpath, content):
+        path = os.path.join(self.project_folder, relpath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+
+    def request(self, method, path):
+        connection = http.client.HTTPConnection(*self.server.server_address)
+        self.addCleanup(connection.close)
+        connection.request(method, path)
+        return connection.getresponse()
+
+    def test_injects_the_live_reload_script(self):
+        response = self.request("GET", "/page/")
+        content = response.read()
+        self.assertEqual(response.status, 200)
+        self.assertIn(LIVE_RELOAD_SCRIPT.encode("utf-8") + b"</body>", content)
+        self.assertEqual(int(response.getheader("Content-Length")), len(content))
+
+    def test_head_reports_the_served_length(self):
+        length = len(self.request("GET", "/page/").read())
+        response = self.request("HEAD", "/page/")
+        self.assertEqual(response.status, 200)
+        self.assertEqual(int(response.getheader("Content-Length")), length)
+        self.assertEqual(response.read(), b"")
+
+    def test_other_files_are_served_as_is(self):
+        response = self.request("GET", "/static.txt")
+        self.assertEqual(response.read(), b"Static\n")
+
+    def test_reload_event_after_a_build(self):
+        response = self.request("GET", EVENTS_PATH)
+        self.assertEqual(response.getheader("Content-Type"), "text/event-stream")
+        self.write("page.md", "title: Page\n\nHello again\n")
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(response.fp.readline(), b"data: reload\n")
+        self.assertIn(b"Hello again", self.request("GET", "/page/").read())
+
+
+if __name__ == "__main__":
+    unittest.main()
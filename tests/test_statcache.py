@@ -0,0 +1,68 @@
+"""
+Tests the file status cache.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from rstblog.statcache import StatCache
+
+
+class StatCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+
+    def write(self, name):
+        path = os.path.join(self.folder, name)
+        with open(path, "w") as f:
+            f.write(name)
+        return path
+
+    def test_caches_until_invalidated(self):
+        path = self.write("a.txt")
+        cache = StatCache()
+        mtime = cache.get_mtime(path)
+        self.assertEqual(mtime, os.path.getmtime(path))
+
+        os.utime(path, (mtime + 10, mtime + 10))
+        self.assertEqual(cache.get_mtime(path), mtime)
+        cache.invalidate(path)
+        self.assertEqual(cache.get_mtime(path), mtime + 10)
+
+        os.unlink(path)
+        cache.clear()
+        self.assertFalse(cache.exists(path))
+        self.assertIsNone(cache.get_mtime(path))
+
+    def test_scanned_folders(self):
+        path = self.write("a.txt")
+        cache = StatCache()
+        with os.scandir(self.folder) as entries:
+            cache.add_scandir_entries(self.folder, list(entries))
+        self.assertTrue(cache.exists(path))
+
+        # Files missing from a scanned folder are known not to exist
+        new_path = self.write("b.txt")
+        self.assertFalse(cache.exists(new_path))
+        # Until a file of the folder is modified
+        cache.invalidate(path)
+        self.assertTrue(cache.exists(new_path))
+
+    def test_file_removed_after_the_scan(self):
+        path = self.write("a.txt")
+        cache = StatCache()
+        with os.scandir(self.folder) as entries:
+            cache.add_scandir_entries(self.folder, list(entries))
+        os.unlink(path)
+        self.assertFalse(cache.exists(path))
+
+    def test_missing_folder(self):
+        path = self.write("a.txt")
+        self.assertFalse(StatCache().exists(os.path.join(path, "b.txt")))
+
+
+if __name__ == "__main__":
+    unittest.main()
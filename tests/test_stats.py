@@ -0,0 +1,79 @@
+"""
+Tests the build statistics and the profile.
+"""
+
+import json
+import unittest
+
+from rstblog.stats import BuildStats
+
+
+class BuildStatsTestCase(unittest.TestCase):
+    def test_measure(self):
+        stats = BuildStats()
+        with stats.measure("markdown", "a.md"):
+            pass
+        with stats.measure("markdown", "b.md"):
+            pass
+        with stats.measure("feeds"):
+            pass
+        self.assertEqual(stats.timings["markdown"][0], 2)
+        self.assertEqual(stats.timings["feeds"][0], 1)
+        self.assertEqual(sorted(stats.file_timings), ["a.md", "b.md"])
+        # Events are only recorded when profiling
+        self.assertEqual(stats.events, [])
+
+    def test_take_and_merge(self):
+        worker = BuildStats(profiling=True)
+        with worker.measure("markdown", "a.md"):
+            pass
+        worker.count("output bytes written", 10)
+        taken = worker.take()
+        self.assertEqual(worker.timings, {})
+        self.assertEqual(worker.events, [])
+
+        stats = BuildStats()
+        with stats.measure("markdown", "a.md"):
+            pass
+        stats.count("output bytes written", 5)
+        stats.merge(taken)
+        self.assertEqual(stats.timings["markdown"][0], 2)
+        self.assertEqual(stats.counters["output bytes written"], [2, 15])
+        self.assertEqual(list(stats.file_timings), ["a.md"])
+        self.assertEqual([x["name"] for x in stats.events], ["markdown"])
+
+    def test_format_profile(self):
+        stats = BuildStats()
+        for name in ["a.md", "b.md", "c.md"]:
+            with stats.measure("markdown", name):
+                pass
+        stats.file_timings["b.md"][0] = 10.0
+        lines = stats.format_profile(top=2)
+        self.assertTrue(lines[0].startswith("step"))
+        self.assertTrue(lines[1].startswith("markdown"))
+        self.assertEqual(lines[2], "")
+        self.assertTrue(lines[3].startswith("slowest files"))
+        self.assertEqual(len(lines), 6)
+        self.assertTrue(lines[4].startswith("b.md"))
+
+    def test_trace(self):
+        stats = BuildStats(profiling=True)
+        with stats.measure("build MarkdownProgram", "a.md"):
+            with stats.measure("markdown"):
+                pass
+        stats.count("output bytes written", 10)
+        trace = json.loads(json.dumps(stats.get_trace()))
+        events = trace["traceEvents"]
+        self.assertEqual(
+            sorted(x["name"] for x in events), ["build MarkdownProgram", "markdown"]
+        )
+        self.assertEqual(min(x["ts"] for x in events), 0)
+        self.assertEqual(events[1]["args"], {"file": "a.md"})
+        other = trace["otherData"]
+        self.assertEqual(other["timings"]["markdown"]["count"], 1)
+        self.assertIn("a.md", other["files"])
+        self.assertEqual(other["counters"]["output bytes written"]["total"], 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+"""
+Tests thumbnail generation and the thumbnail index.
+"""
+
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import PIL.Image
+
+from rstblog.thumbnails import ThumbnailGenerator
+
+
+class ThumbnailGeneratorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        self.index_filename = os.path.join(self.folder, "cache", "thumbnails")
+
+    def get_path(self, relpath):
+        return os.path.join(self.folder, relpath)
+
+    def create_image(self, relpath, size=(800, 600)):
+        PIL.Image.new("RGB", size, "red").save(self.get_path(relpath))
+
+    def create_generator(self, **kwargs):
+        generator = ThumbnailGenerator(self.index_filename, **kwargs)
+        self.addCleanup(generator.shutdown)
+        generator.load()
+        return generator
+
+    def generate(self, generator, *args):
+        """Calls generator.generate(), returns the thumbnail and whether it
+        has been generated"""
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            thumbnail = generator.generate(self.folder, *args)
+        return thumbnail, "Generating thumbnail" in out.getvalue()
+
+    def test_index_avoids_opening_thumbnails(self):
+        self.create_image("a.jpg")
+        generator = self.create_generator(max_workers=1)
+        thumbnail, generated = self.generate(generator, "a.jpg", 100)
+        self.assertTrue(generated)
+        self.assertEqual(thumbnail[:3], ("thumb_100_a.jpg", 100, 75))
+        generator.save()
+
+        # A broken thumbnail is not noticed, since it is never opened
+        with open(self.get_path("thumb_100_a.jpg"), "w") as f:
+            f.write("not an image")
+        generator = self.create_generator(max_workers=1)
+        thumbnail, generated = self.generate(generator, "a.jpg", 100)
+        self.assertFalse(generated)
+        self.assertEqual(thumbnail[:3], ("thumb_100_a.jpg", 100, 75))
+
+    def test_regenerated_when_the_image_changes(self):
+        self.create_image("a.jpg")
+        generator = self.create_generator(max_workers=1)
+        self.generate(generator, "a.jpg", 100)
+
+        self.create_image("a.jpg", (600, 800))
+        mtime = os.path.getmtime(self.get_path("thumb_100_a.jpg")) + 10
+        os.utime(self.get_path("a.jpg"), (mtime, mtime))
+        thumbnail, generated = self.generate(generator, "a.jpg", 100)
+        self.assertTrue(generated)
+        self.assertEqual(thumbnail[1:3], (75, 100))
+
+    def test_regenerated_when_the_parameters_change(self):
+        self.create_image("a.jpg")
+        generator = self.create_generator(max_workers=1)
+        self.generate(generator, "a.jpg", 100)
+        generator.save()
+
+        generator = self.create_generator(max_workers=1, resample="lanczos")
+        _, generated = self.generate(generator, "a.jpg", 100)
+        self.assertTrue(generated)
+
+    def test_submitted_thumbnails_are_generated_in_parallel(self):
+        for idx in range(4):
+            self.create_image("%d.jpg" % idx)
+        generator = self.create_generator(max_workers=2)
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            futures = [
+                generator.submit(self.folder, "%d.jpg" % x, 100, square=True)
+                for x in range(4)
+            ]
+            # Requesting a thumbnail being generated does not generate it again
+            futures.append(generator.submit(self.folder, "0.jpg", 100, square=True))
+            thumbnails = [x.result() for x in futures]
+        self.assertEqual(out.getvalue().count("Generating thumbnail"), 4)
+        self.assertEqual(
+            [x[:3] for x in thumbnails],
+            [("thumb_100sq_%d.jpg" % x, 100, 100) for x in [0, 1, 2, 3, 0]],
+        )
+        self.assertEqual(len(generator.take_new_entries()), 4)
+        self.assertEqual(generator.take_new_entries(), {})
+
+    def test_save_only_writes_changes(self):
+        self.create_image("a.jpg")
+        generator = self.create_generator(max_workers=1)
+        self.generate(generator, "a.jpg", 100)
+        generator.save()
+        os.utime(self.index_filename, ns=(0, 0))
+
+        generator = self.create_generator(max_workers=1)
+        self.generate(generator, "a.jpg", 100)
+        generator.save()
+        self.assertEqual(os.stat(self.index_filename).st_mtime_ns, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
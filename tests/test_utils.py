@@ -0,0 +1,35 @@
+"""
+Tests the ignore pattern matcher.
+"""
+
+import unittest
+
+from rstblog.utils import IgnoreMatcher
+
+
+class IgnoreMatcherTestCase(unittest.TestCase):
+    def test_ignores_matching_filenames(self):
+        matcher = IgnoreMatcher([".*", "_*", "*.yml"])
+        self.assertTrue(matcher.is_ignored(".git"))
+        self.assertTrue(matcher.is_ignored("_build"))
+        self.assertTrue(matcher.is_ignored("config.yml"))
+        self.assertFalse(matcher.is_ignored("page.md"))
+        self.assertFalse(matcher.is_ignored("yml"))
+
+    def test_first_matching_pattern_decides(self):
+        matcher = IgnoreMatcher(["!_keep.txt", "_*", "!_late.txt"])
+        self.assertFalse(matcher.is_ignored("_keep.txt"))
+        self.assertTrue(matcher.is_ignored("_late.txt"))
+        self.assertTrue(matcher.is_ignored("_other.txt"))
+
+    def test_no_patterns(self):
+        matcher = IgnoreMatcher([])
+        self.assertFalse(matcher.is_ignored(".git"))
+
+    def test_filter(self):
+        matcher = IgnoreMatcher(["*.log"])
+        self.assertEqual(matcher.filter(["a.md", "b.log", "c.txt"]), ["a.md", "c.txt"])
+
+
+if __name__ == "__main__":
+    unittest.main()